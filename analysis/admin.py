@@ -1,12 +1,15 @@
 from django.contrib import admin
 
-from .models import SearchHistory
+from .models import SearchHistory, SearchProfile, SearchResultPayload
 
 
 @admin.register(SearchHistory)
 class SearchHistoryAdmin(admin.ModelAdmin):
-    list_display = ('user', 'search_type', 'car_input', 'municipio', 'uf', 'sucesso', 'created_at')
-    list_filter = ('search_type', 'sucesso', 'uf')
+    list_display = (
+        'user', 'search_type', 'car_input', 'municipio', 'uf', 'sucesso',
+        'duration_ms', 'slowest_layer', 'created_at',
+    )
+    list_filter = ('search_type', 'sucesso', 'uf', 'slowest_layer')
     search_fields = ('car_input', 'municipio', 'user__username')
     readonly_fields = [f.name for f in SearchHistory._meta.fields]
 
@@ -15,3 +18,30 @@ class SearchHistoryAdmin(admin.ModelAdmin):
 
     def has_change_permission(self, request, obj=None):
         return False
+
+
+@admin.register(SearchResultPayload)
+class SearchResultPayloadAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'size_bytes', 'created_at')
+    search_fields = ('content_hash',)
+    readonly_fields = ('content_hash', 'size_bytes', 'created_at')
+    exclude = ('data',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SearchProfile)
+class SearchProfileAdmin(admin.ModelAdmin):
+    list_display = ('history', 'size_bytes', 'created_at')
+    readonly_fields = ('history', 'size_bytes', 'created_at')
+    exclude = ('data',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,168 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:30
+
+import hashlib
+import json
+import zlib
+
+import django.db.models.deletion
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+# Cópia congelada dos helpers de `analysis.models` e
+# `analysis.services.view_services.result_schema` na época desta migração: a
+# migração não pode mudar de comportamento quando o código da aplicação mudar.
+
+_STORED_COORDINATE_DECIMALS = 7
+_PAYLOAD_REQUEST_KEYS = ('car_input', 'coordenadas_recebidas', 'municipio', 'uf')
+_PAYLOAD_TIMING_KEYS = ('tempo_execucao_segundos', 'tempo_execucao_formatado', 'performance')
+
+
+def _quantize(coords, decimals):
+    if isinstance(coords, (list, tuple)):
+        if coords and isinstance(coords[0], (int, float)):
+            return [round(c, decimals) for c in coords]
+        return [_quantize(c, decimals) for c in coords]
+    return coords
+
+
+def _quantize_geojson(geojson, decimals):
+    data = json.loads(geojson) if isinstance(geojson, str) else dict(geojson)
+    if 'coordinates' in data:
+        data['coordinates'] = _quantize(data['coordinates'], decimals)
+    if 'geometries' in data:
+        data['geometries'] = [_quantize_geojson(g, decimals) for g in data['geometries']]
+    return data
+
+
+class _GeometryTable:
+
+    def __init__(self):
+        self.items = []
+        self._index = {}
+
+    def ref(self, geojson):
+        if not geojson:
+            return None
+        try:
+            compact = _quantize_geojson(geojson, _STORED_COORDINATE_DECIMALS)
+        except (TypeError, ValueError):
+            return None
+        key = json.dumps(compact, separators=(',', ':'), sort_keys=True)
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.items)
+            self.items.append(compact)
+            self._index[key] = index
+        return index
+
+
+def _compact_row(row, geometries):
+    row = dict(row)
+    row.pop('polygon_wkt', None)
+    row['geom_ref'] = geometries.ref(row.pop('polygon_geojson', None))
+    return row
+
+
+def _compact_resultado(resultado):
+    if not resultado or resultado.get('versao') == 2:
+        return resultado
+
+    geometries = _GeometryTable()
+    compact = dict(resultado)
+    compact['versao'] = 2
+    compact.pop('areas_encontradas', None)
+    compact.pop('alvo_wkt', None)
+    compact['alvo_ref'] = geometries.ref(compact.pop('alvo_geojson', None))
+    compact['resultados_por_base'] = [
+        {
+            **base,
+            'areas_encontradas': [
+                _compact_row(row, geometries) for row in base.get('areas_encontradas') or []
+            ],
+        }
+        for base in resultado.get('resultados_por_base') or []
+    ]
+    compact['poligonos_imoveis'] = [
+        _compact_row(p, geometries) for p in resultado.get('poligonos_imoveis') or []
+    ]
+    compact['geometrias'] = geometries.items
+    return compact
+
+
+def _payload_content(data):
+    content = {}
+    for key, value in data.items():
+        if key in _PAYLOAD_REQUEST_KEYS:
+            continue
+        if key == 'resultado' and isinstance(value, dict):
+            value = {
+                k: v for k, v in _compact_resultado(value).items()
+                if k not in _PAYLOAD_TIMING_KEYS
+            }
+        content[key] = value
+    return content
+
+
+def _encode_result_payload(data):
+    raw = json.dumps(
+        data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest(), zlib.compress(raw)
+
+
+def move_result_data_to_payloads(apps, schema_editor):
+    """Move `result_data` dos registros existentes para a tabela de payloads
+    (já no formato compacto v2, sem os campos da execução, deduplicando
+    resultados idênticos) e esvazia a coluna antiga."""
+    SearchHistory = apps.get_model('analysis', 'SearchHistory')
+    SearchResultPayload = apps.get_model('analysis', 'SearchResultPayload')
+
+    pending = []
+    queryset = SearchHistory.objects.filter(payload__isnull=True).exclude(result_data={})
+    for history in queryset.only('id', 'result_data').iterator(chunk_size=200):
+        content_hash, blob = _encode_result_payload(_payload_content(history.result_data))
+        payload, _ = SearchResultPayload.objects.get_or_create(
+            content_hash=content_hash,
+            defaults={'data': blob, 'size_bytes': len(blob)},
+        )
+        history.payload = payload
+        history.result_data = {}
+        pending.append(history)
+        if len(pending) >= 200:
+            SearchHistory.objects.bulk_update(pending, ['payload', 'result_data'])
+            pending = []
+
+    if pending:
+        SearchHistory.objects.bulk_update(pending, ['payload', 'result_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0003_searchhistory_idx_search_car_input_trgm_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchResultPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Resultado de Busca',
+                'verbose_name_plural': 'Resultados de Busca',
+                'db_table': 'tb_search_result_payload',
+            },
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='searches', to='analysis.searchresultpayload'),
+        ),
+        migrations.RunPython(move_result_data_to_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0005_searchhistory_entry_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchhistory',
+            name='duration_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='sql_queries',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='slowest_layer',
+            field=models.CharField(blank=True, default='', max_length=60),
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='slowest_layer_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='layers_not_evaluated',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='layer_metrics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0006_searchhistory_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to='analysis.searchhistory')),
+            ],
+            options={
+                'verbose_name': 'Perfil de Busca',
+                'verbose_name_plural': 'Perfis de Busca',
+                'db_table': 'tb_search_profile',
+            },
+        ),
+    ]
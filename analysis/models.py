@@ -1,14 +1,97 @@
+import hashlib
+import json
+import zlib
+
 from django.conf import settings
 from django.contrib.postgres.indexes import GinIndex
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 
+# Campos de cada execução, não do resultado: ficam nas colunas do
+# `SearchHistory` (`car_input`, `municipio`, `uf`, `duration_ms`,
+# `layer_metrics`...) e fora do payload, senão nenhum resultado se repete.
+PAYLOAD_REQUEST_KEYS = ('car_input', 'coordenadas_recebidas', 'municipio', 'uf')
+PAYLOAD_TIMING_KEYS = ('tempo_execucao_segundos', 'tempo_execucao_formatado', 'performance')
+
+
+def result_payload_content(data):
+    """Parte determinística de um resultado (dict de `compact_analysis`):
+    o que vai para `SearchResultPayload` e entra no hash."""
+    content = {k: v for k, v in data.items() if k not in PAYLOAD_REQUEST_KEYS}
+    resultado = content.get('resultado')
+    if isinstance(resultado, dict):
+        content['resultado'] = {
+            k: v for k, v in resultado.items() if k not in PAYLOAD_TIMING_KEYS
+        }
+    return content
+
+
+def format_duration(seconds):
+    """Duração amigável (ms, s, m s), como a exibida ao fim da busca."""
+    if seconds < 1:
+        return f"{int(seconds * 1000)} ms"
+    if seconds < 60:
+        return f"{seconds:.2f} s"
+    return f"{int(seconds // 60)}m {seconds % 60:.1f}s"
+
+
+def encode_result_payload(data):
+    """(hash sha256, bytes comprimidos) do JSON canônico de um resultado —
+    chaves ordenadas, para que o mesmo resultado gere sempre o mesmo hash."""
+    raw = json.dumps(
+        data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest(), zlib.compress(raw)
+
+
+class SearchResultPayloadManager(models.Manager):
+
+    def store(self, data):
+        """Devolve o payload do resultado, gravando-o só se o conteúdo
+        ainda não existe na tabela. Os campos da execução
+        (`result_payload_content`) não são gravados."""
+        content_hash, blob = encode_result_payload(result_payload_content(data))
+        payload, _ = self.get_or_create(
+            content_hash=content_hash,
+            defaults={'data': blob, 'size_bytes': len(blob)},
+        )
+        return payload
+
+
+class SearchResultPayload(models.Model):
+    """Resultado completo de uma busca, comprimido e endereçado pelo
+    conteúdo: buscas com resultado idêntico (ex.: vários usuários
+    consultando o mesmo CAR) apontam para a mesma linha."""
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size_bytes = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SearchResultPayloadManager()
+
+    class Meta:
+        db_table = 'tb_search_result_payload'
+        verbose_name = "Resultado de Busca"
+        verbose_name_plural = "Resultados de Busca"
+
+    def load(self):
+        return json.loads(zlib.decompress(bytes(self.data)).decode('utf-8'))
+
+    def __str__(self):
+        return self.content_hash
+
+
 class SearchHistory(models.Model):
     """Registro de cada busca de sobreposição executada por um usuário.
 
-    Guarda o mesmo dict que hoje fica só em `request.session['last_analysis']`
-    (ver `analysis/views.py`), para que o painel administrativo
-    (`control_panel`) possa listar e reabrir o que os usuários pesquisaram.
+    O resultado da busca (o mesmo dict guardado no `ResultStore`, ver
+    `analysis/views.py`, sem os campos da execução — ver
+    `result_payload_content`) fica em `SearchResultPayload`, referenciado por
+    `payload`, para que o painel administrativo (`control_panel`) possa
+    listar e reabrir o que os usuários pesquisaram. `result_data` só é
+    preenchido em registros anteriores à tabela de payloads.
     """
 
     class SearchType(models.TextChoices):
@@ -31,6 +114,21 @@ class SearchHistory(models.Model):
     sucesso = models.BooleanField(default=True)
     erro = models.TextField(blank=True, default='')
     result_data = models.JSONField(default=dict, blank=True)
+    payload = models.ForeignKey(
+        SearchResultPayload, null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='searches',
+    )
+    # Id gerado pela view antes de enfileirar a gravação: torna a task de
+    # histórico idempotente quando a mensagem é entregue mais de uma vez.
+    entry_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    # Instrumentação da busca (`performance` de `SearchAll`): permite achar
+    # as buscas lentas e a camada responsável sem abrir o payload.
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    sql_queries = models.PositiveIntegerField(null=True, blank=True)
+    slowest_layer = models.CharField(max_length=60, blank=True, default='')
+    slowest_layer_ms = models.PositiveIntegerField(null=True, blank=True)
+    layers_not_evaluated = models.PositiveSmallIntegerField(default=0)
+    layer_metrics = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
@@ -47,6 +145,57 @@ class SearchHistory(models.Model):
             GinIndex(fields=['municipio'], name='idx_search_municipio_trgm', opclasses=['gin_trgm_ops']),
         ]
 
+    def get_result_data(self):
+        """Resultado da busca, do payload ou (registros antigos) de
+        `result_data`. Os campos da execução, que não vão para o payload,
+        voltam das colunas deste registro."""
+        if not self.payload_id:
+            return dict(self.result_data or {})
+
+        data = self.payload.load()
+        data.setdefault('car_input', self.car_input)
+        data.setdefault('municipio', self.municipio)
+        data.setdefault('uf', self.uf)
+        resultado = data.get('resultado')
+        if isinstance(resultado, dict) and self.duration_ms is not None:
+            seconds = self.duration_ms / 1000
+            resultado.setdefault('tempo_execucao_segundos', seconds)
+            resultado.setdefault('tempo_execucao_formatado', format_duration(seconds))
+            resultado.setdefault('performance', {
+                'time_total': seconds,
+                'sql_queries': self.sql_queries,
+                'layers': self.layer_metrics,
+            })
+        return data
+
     def __str__(self):
         alvo = self.car_input or self.municipio or 'busca'
         return f"{alvo} — {self.created_at:%d/%m/%Y %H:%M}"
+
+
+class SearchProfile(models.Model):
+    """Perfil de uma busca executada em modo de perfil (`?profile=1`, só
+    staff): cProfile, consultas SQL com `EXPLAIN (ANALYZE, BUFFERS)` e o
+    `performance` da busca (ver `SearchProfiler`), em JSON comprimido."""
+
+    history = models.OneToOneField(
+        SearchHistory, on_delete=models.CASCADE, related_name='profile',
+    )
+    data = models.BinaryField()
+    size_bytes = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'tb_search_profile'
+        verbose_name = "Perfil de Busca"
+        verbose_name_plural = "Perfis de Busca"
+
+    @classmethod
+    def encode(cls, bundle):
+        return zlib.compress(json.dumps(bundle, cls=DjangoJSONEncoder).encode('utf-8'))
+
+    def load(self):
+        return json.loads(zlib.decompress(bytes(self.data)).decode('utf-8'))
+
+    def __str__(self):
+        return f"Perfil — {self.history}"
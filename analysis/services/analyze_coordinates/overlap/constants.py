@@ -0,0 +1,3 @@
+UTM_SRID = 31982  # SIRGAS 2000 / UTM 22S
+MIN_INTER_AREA_HA = 0.001  # Descartar intersecções muito pequenas
+SICAR_FULL_OVERLAP_THRESHOLD = 98  # Descartar quando cobre ≥98% do polígono do SICAR
@@ -2,6 +2,33 @@ from django.contrib.gis.geos import GEOSGeometry
 
 from kernel.utils import cached_model_count
 
+# Nome técnico do modelo -> nome amigável da base exibido na UI.
+BASE_NAMES = {
+    "SicarRecord": "Base de Dados Sicar",
+    "DeclaredHydrography": "Base de Dados de Hidrografia Declarada",
+    "ZoningArea": "Base de Dados de Zoneamento",
+    "PhytoecologyArea": "Base de Dados de Fitoecologias",
+    "EnvironmentalProtectionArea": "Base de Dados de APAs",
+    "IndigenousArea": "Base de Dados de Indígenas",
+    "Quilombolas": "Base de Dados de Quilombolas",
+    "Paths": "Base de Dados de Veredas",
+    "ConservationUnits": "Base de Dados de Unidades de Conservação",
+    "MunicipalBoundaries": "Base de Dados de Municípios",
+    "Sigef": "Base de Dados Sigef",
+    "Ruralsettlement": "Base de Dados de Assentamentos Rurais",
+    "SnicTotal": "Base de Dados SNIC Total",
+    "DeforestationMapbiomas": "Base de Deforestação Mapbiomas",
+    "Embargoes": "Base de Embargos do IBAMA",
+    "Ipuca": "Base de Dados IPUCA",
+    "Prodes": "Base de Dados Prodes",
+}
+
+
+def base_name(layer_name):
+    """Nome amigável da base a partir do nome do modelo da camada."""
+    return BASE_NAMES.get(layer_name, layer_name)
+
+
 class FinalResultBuilder:
 
     def build(self, target, results_by_layer, layers):
@@ -11,15 +38,22 @@ class FinalResultBuilder:
         - Normaliza e agrupa registros por camada quando necessário.
         - Monta a lista de bases com contagens e áreas encontradas.
         - Calcula o resumo de quantidade de registros por base.
+        - Camadas que voltaram como None (consulta cancelada pelo limite de
+          tempo do pipeline) entram como "não avaliadas".
         """
 
         bases_output = []
         all_areas = []
         property_polygons = []
+        not_evaluated = 0
 
         for layer in layers:
             layer_name = layer.__name__
             original_records = results_by_layer.get(layer_name, [])
+            evaluated = original_records is not None
+            if not evaluated:
+                original_records = []
+                not_evaluated += 1
 
             grouped_records = self._group_records(layer_name, original_records)
 
@@ -27,20 +61,22 @@ class FinalResultBuilder:
             grouped_records.sort(key=lambda x: float(x.get("area") or 0), reverse=True)
 
             base_entry = self._build_base_entry(layer, grouped_records)
+            if not evaluated:
+                base_entry["quantidade_nao_avaliados"] = 1
             bases_output.append(base_entry)
 
             all_areas.extend(grouped_records)
 
             for r in original_records:
                 r["color"] = self._base_color(layer)
-                wkt = r.get("polygon_wkt")
                 gj = r.get("polygon_geojson")
+                # Só o GeoJSON vai para o mapa; o WKT já está no registro da
+                # base e não precisa ser duplicado aqui.
                 if isinstance(gj, str) and gj.strip().startswith("{"):
                     property_polygons.append({
                         "fonte": self._base_name(layer),
                         "item_info": r.get("item_info"),
                         "area": r.get("area"),
-                        "polygon_wkt": wkt,
                         "polygon_geojson": gj,
                         "color": self._base_color(layer),
                     })
@@ -60,7 +96,7 @@ class FinalResultBuilder:
         data = {
             "resultados_por_base": bases_output,
             "areas_encontradas": all_areas,
-            "quantidade_nao_avaliados": 0,
+            "quantidade_nao_avaliados": not_evaluated,
             "total_areas_com_sobreposicao": len(all_areas),
             "area_preservada_total": self._get_fitoecologia_preserved_area(bases_output),
             "tamanho_area": target.area_ha,
@@ -175,26 +211,7 @@ class FinalResultBuilder:
         """
         Mapeia o nome técnico do modelo para o nome amigável exibido na UI.
         """
-        mapping = {
-            "SicarRecord": "Base de Dados Sicar",
-            "DeclaredHydrography": "Base de Dados de Hidrografia Declarada",
-            "ZoningArea": "Base de Dados de Zoneamento",
-            "PhytoecologyArea": "Base de Dados de Fitoecologias",
-            "EnvironmentalProtectionArea": "Base de Dados de APAs",
-            "IndigenousArea": "Base de Dados de Indígenas",
-            "Quilombolas": "Base de Dados de Quilombolas",
-            "Paths": "Base de Dados de Veredas",
-            "ConservationUnits": "Base de Dados de Unidades de Conservação",
-            "MunicipalBoundaries": "Base de Dados de Municípios",
-            "Sigef": "Base de Dados Sigef",
-            "Ruralsettlement": "Base de Dados de Assentamentos Rurais",
-            "SnicTotal": "Base de Dados SNIC Total",
-            "DeforestationMapbiomas": "Base de Deforestação Mapbiomas",
-            "Embargoes": "Base de Embargos do IBAMA",
-            "Ipuca": "Base de Dados IPUCA",
-            "Prodes": "Base de Dados Prodes",
-        }
-        return mapping.get(layer.__name__, layer.__name__)
+        return base_name(layer.__name__)
 
     def _base_color(self, layer):
         mapping = {
@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+STATUS_OK = "ok"
+STATUS_CACHED = "cached"
+STATUS_NOT_EVALUATED = "not_evaluated"
+
+
+class _QueryCounter:
+    """`execute_wrapper` que conta as consultas SQL da conexão da thread."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _empty_layer():
+    return {
+        "status": STATUS_OK,
+        "query_time": 0.0,
+        "query_layers": 0,
+        "rows_returned": 0,
+        "rows_discarded": 0,
+        "geometry_bytes": 0,
+        "formatter_time": 0.0,
+        "sql_queries": 0,
+    }
+
+
+class LayerMetrics:
+    """
+    Instrumentação por camada de uma execução do `OverlapPipeline`.
+
+    Para cada camada guarda o tempo da consulta (`query_time`), quantas
+    camadas essa consulta trouxe junto (`query_layers`: no modo
+    "single_query" o tempo é o do `UNION ALL` inteiro, compartilhado), linhas
+    devolvidas pelo banco e descartadas no Python, bytes de geometria
+    (EWKB) recebidos, tempo dos Formatters e número de consultas SQL.
+
+    `sql_queries` soma as consultas da execução inteira, cada uma contada
+    uma vez (a consulta compartilhada do "single_query" não se repete por
+    camada). Preenchido pelas threads do modo "parallel" ao mesmo tempo; as
+    atualizações são serializadas por um lock.
+    """
+
+    def __init__(self):
+        self._layers = {}
+        self._lock = threading.Lock()
+        self.sql_queries = 0
+
+    def add(self, layer_name, **values):
+        with self._lock:
+            layer = self._layers.setdefault(layer_name, _empty_layer())
+            for key, value in values.items():
+                if key in ("status", "query_layers"):
+                    layer[key] = value
+                else:
+                    layer[key] += value
+
+    def add_query_stats(self, stats):
+        """Soma as estatísticas de `MultiLayerOverlapQuery.execute(stats=...)`."""
+        for layer_name, values in stats.items():
+            self.add(layer_name, **values)
+
+    @contextmanager
+    def measure_query(self, layer_names):
+        """Mede tempo e consultas SQL de uma consulta que traz `layer_names`."""
+        counter = _QueryCounter()
+        t0 = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.sql_queries += counter.count
+            for layer_name in layer_names:
+                self.add(
+                    layer_name,
+                    query_time=elapsed,
+                    query_layers=len(layer_names),
+                    sql_queries=counter.count,
+                )
+
+    @contextmanager
+    def measure_formatter(self, layer_name):
+        counter = _QueryCounter()
+        t0 = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                yield
+        finally:
+            with self._lock:
+                self.sql_queries += counter.count
+            self.add(
+                layer_name,
+                formatter_time=time.perf_counter() - t0,
+                sql_queries=counter.count,
+            )
+
+    def as_dict(self):
+        with self._lock:
+            return {name: dict(values) for name, values in self._layers.items()}
@@ -0,0 +1,284 @@
+import json
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import OperationalError, connection, transaction
+
+from car_system.models import SicarRecord
+from kernel.service.subdivided_geometry_service import SubdividedGeometryService
+
+from analysis.services.analyze_coordinates.overlap.constants import (
+    MIN_INTER_AREA_HA,
+    SICAR_FULL_OVERLAP_THRESHOLD,
+    UTM_SRID,
+)
+
+# Colunas que nunca viajam no JSON de atributos: o WKT bruto (`geometry`) e as
+# geometrias PostGIS podem ter megabytes por linha e nenhum Formatter as usa —
+# a geometria que interessa é a da intersecção, devolvida em coluna própria.
+_EXCLUDED_ATTRIBUTE_FIELDS = {"geometry", "usable_geometry", "usable_geometry_utm"}
+
+SRID = 4674
+
+# SQLSTATE do Postgres para consulta cancelada (`statement_timeout`).
+_QUERY_CANCELED = "57014"
+
+
+class OverlapQueryTimeout(Exception):
+    """A consulta de intersecção estourou o `statement_timeout` informado."""
+
+    def __init__(self, layers):
+        self.layers = [layer.__name__ for layer in layers]
+        super().__init__(f"Tempo esgotado nas camadas: {', '.join(self.layers)}")
+
+
+def _is_query_canceled(exc):
+    cause = exc.__cause__
+    return (getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)) == _QUERY_CANCELED
+
+
+class MultiLayerOverlapQuery:
+    """
+    Calcula as intersecções do alvo com várias camadas em um único round trip
+    ao PostGIS.
+
+    Monta um `UNION ALL` com um ramo por camada, todos lendo o alvo de uma
+    CTE (`alvo`) — a geometria é enviada ao banco uma única vez, não uma vez
+    por camada. Cada linha volta marcada com o índice da camada, o id do
+    registro, os atributos do registro em JSON (para reconstruir a instância
+    do Model que os Formatters esperam), a intersecção em EWKB e as métricas
+    de área/percentual já calculadas pelo PostGIS.
+
+    Também é usado com uma única camada pelo caminho sequencial de
+    `OverlapService`, para que os dois modos compartilhem o mesmo SQL.
+    """
+
+    def __init__(self, service):
+        """
+        service: OverlapService do alvo; fornece a geometria/área do alvo e
+        monta o dicionário de cada linha (`_build_result_row`).
+        """
+        self.service = service
+
+    # -----------------------------------------------------------
+    # SQL
+    # -----------------------------------------------------------
+    def _attribute_fields(self, layer_model):
+        return [
+            f for f in layer_model._meta.concrete_fields
+            if f.name not in _EXCLUDED_ATTRIBUTE_FIELDS
+        ]
+
+    def _column(self, layer_model, field_name):
+        qn = connection.ops.quote_name
+        return f"t.{qn(layer_model._meta.get_field(field_name).column)}"
+
+    def _attributes_sql(self, layer_model):
+        qn = connection.ops.quote_name
+        pairs = ", ".join(
+            f"'{f.column}', t.{qn(f.column)}" for f in self._attribute_fields(layer_model)
+        )
+        return f"jsonb_build_object({pairs})"
+
+    def _utm_geometry_sql(self, layer_model):
+        """
+        Geometria da feição em UTM: a coluna pré-calculada
+        `usable_geometry_utm`; reprojeta na hora só linhas que ainda não a
+        têm (importadas antes da coluna existir).
+        """
+        return (
+            f"COALESCE({self._column(layer_model, 'usable_geometry_utm')}, "
+            f"ST_Transform({self._column(layer_model, 'usable_geometry')}, {UTM_SRID}))"
+        )
+
+    def _layer_area_sql(self, layer_model, utm_geom):
+        """
+        Área da feição da camada em m², na mesma ordem de preferência de
+        `OverlapService._get_layer_area_m2`: `area_m2` > `area_ha` > geometria
+        em UTM (o COALESCE só mede quando os campos estão vazios).
+        """
+        area_m2 = self._column(layer_model, "area_m2")
+        area_ha = self._column(layer_model, "area_ha")
+        return (
+            f"COALESCE(NULLIF({area_m2}, 0), NULLIF({area_ha}, 0) * 10000, "
+            f"ST_Area({utm_geom}))"
+        )
+
+    def _discard_sql(self, layer_model):
+        """
+        Regras de descarte de `OverlapService._should_discard` como predicados
+        do WHERE, para que linhas descartadas nunca saiam do banco:
+        - Intersecções menores que `MIN_INTER_AREA_HA`
+        - Para SICAR, o próprio registro do CAR pesquisado (`alvo.car_id`) e
+          intersecções que cobrem ≥98% do polígono do SICAR
+        """
+        predicates = [f"m.area_m2 >= {MIN_INTER_AREA_HA * 10000}"]
+        if layer_model is SicarRecord:
+            predicates.append(f"t.{connection.ops.quote_name('id')} IS DISTINCT FROM alvo.car_id")
+            predicates.append(
+                f"NOT (m.area_camada_m2 > 0 AND "
+                f"m.area_m2 * 100 / m.area_camada_m2 >= {SICAR_FULL_OVERLAP_THRESHOLD})"
+            )
+        return " AND ".join(predicates)
+
+    def _intersection_source_sql(self, layer_model, geom_col):
+        """
+        FROM da camada, expondo a feição como `t`, a intersecção em UTM como
+        `i.geom_utm` e `i.contem` (a feição cobre o alvo inteiro), mais o
+        filtro espacial correspondente.
+
+        Quando `ST_Covers` vale, a intersecção é o próprio alvo: devolve
+        `alvo.geom_utm` sem rodar `ST_Intersection` contra o polígono da
+        camada (o caso comum em município/zoneamento/fitoecologia). O recorte
+        completo só roda para feições que cruzam a borda do alvo, e roda em
+        UTM sobre `usable_geometry_utm` — a camada não é reprojetada por busca.
+
+        Camadas com tabela-sombra subdividida (`SubdividedGeometryService`,
+        já em UTM) intersectam os pedaços pequenos, pelo índice GiST da
+        sombra, e reagrupam o resultado por feição original; as demais filtram
+        pelo índice de `usable_geometry`.
+        """
+        qn = connection.ops.quote_name
+        table = qn(layer_model._meta.db_table)
+        shadow = SubdividedGeometryService(layer_model)
+        if shadow.is_available():
+            source = (
+                f"(SELECT s.id_feicao, "
+                f"bool_or(ST_Covers(s.geometria, alvo.geom_utm)) AS contem, "
+                f"ST_Union(CASE WHEN ST_Covers(s.geometria, alvo.geom_utm) THEN alvo.geom_utm "
+                f"ELSE ST_CollectionExtract(ST_Intersection(s.geometria, alvo.geom_utm), 3) END) AS geom_utm "
+                f"FROM {qn(shadow.table_name)} s CROSS JOIN alvo "
+                f"WHERE ST_Intersects(s.geometria, alvo.geom_utm) GROUP BY s.id_feicao) i "
+                f"JOIN {table} t ON t.{qn('id')} = i.id_feicao CROSS JOIN alvo "
+            )
+            return source, "TRUE"
+        source = (
+            f"{table} t CROSS JOIN alvo "
+            f"CROSS JOIN LATERAL (SELECT ST_Covers({geom_col}, alvo.geom) AS contem) c "
+            f"CROSS JOIN LATERAL (SELECT c.contem, CASE WHEN c.contem THEN alvo.geom_utm "
+            f"ELSE ST_Intersection({self._utm_geometry_sql(layer_model)}, alvo.geom_utm) END AS geom_utm) i "
+        )
+        return source, f"ST_Intersects({geom_col}, alvo.geom)"
+
+    def _branch_sql(self, index, layer_model):
+        qn = connection.ops.quote_name
+        geom_col = self._column(layer_model, "usable_geometry")
+        source, spatial_filter = self._intersection_source_sql(layer_model, geom_col)
+        return (
+            f"SELECT {index} AS camada, t.{qn('id')} AS id, "
+            f"{self._attributes_sql(layer_model)} AS atributos, "
+            # Só a intersecção (pequena) volta para 4674, para exibição.
+            f"ST_AsEWKB(CASE WHEN i.contem THEN alvo.geom "
+            f"ELSE ST_Transform(i.geom_utm, {SRID}) END) AS intersecao, "
+            f"m.area_m2 AS area_intersecao_m2, "
+            f"CASE WHEN m.area_camada_m2 > 0 THEN m.area_m2 * 100 / m.area_camada_m2 ELSE 0 END AS percentual_camada, "
+            f"CASE WHEN alvo.area_m2 > 0 THEN m.area_m2 * 100 / alvo.area_m2 ELSE 0 END AS percentual_alvo "
+            f"FROM {source}"
+            # Alvo coberto: a área já é a do alvo (`GeometryTarget.area_m2`).
+            f"CROSS JOIN LATERAL (SELECT CASE WHEN i.contem THEN alvo.area_m2 "
+            f"ELSE ST_Area(i.geom_utm) END AS area_m2, "
+            f"{self._layer_area_sql(layer_model, self._utm_geometry_sql(layer_model))} AS area_camada_m2) m "
+            f"WHERE {spatial_filter} AND NOT ST_IsEmpty(i.geom_utm) "
+            f"AND {self._discard_sql(layer_model)}"
+        )
+
+    def build_sql(self, layers):
+        branches = "\nUNION ALL\n".join(
+            self._branch_sql(index, layer) for index, layer in enumerate(layers)
+        )
+        sql = (
+            "WITH alvo AS (SELECT ST_GeomFromEWKB(%s) AS geom, ST_GeomFromEWKB(%s) AS geom_utm, "
+            "%s::double precision AS area_m2, %s::bigint AS car_id)\n"
+            f"{branches}"
+        )
+        car = getattr(self.service.target, "car", None)
+        params = [
+            bytes(self.service.target_geom.ewkb),
+            bytes(self.service.target_geom.transform(UTM_SRID, clone=True).ewkb),
+            self.service.target_area_m2,
+            car.pk if car is not None else None,
+        ]
+        return sql, params
+
+    # -----------------------------------------------------------
+    # Leitura das linhas
+    # -----------------------------------------------------------
+    def _build_instance(self, layer_model, attributes):
+        """
+        Reconstrói a instância do Model a partir do JSON de atributos, sem
+        um SELECT extra. Campos pesados (geometrias) ficam como adiados.
+        O backend do Django devolve `jsonb` como texto (psycopg 3).
+        """
+        if isinstance(attributes, str):
+            attributes = json.loads(attributes)
+        fields = self._attribute_fields(layer_model)
+        values = [f.to_python(attributes.get(f.column)) for f in fields]
+        return layer_model.from_db(
+            connection.alias, [f.attname for f in fields], values
+        )
+
+    def _fetch(self, sql, params, timeout_ms):
+        if not timeout_ms:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+        # `set_config(..., true)` equivale a `SET LOCAL`: vale só para a
+        # transação aberta aqui, e a conexão volta ao timeout padrão ao sair
+        # do bloco, mesmo quando a consulta é cancelada.
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(timeout_ms))])
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+    def execute(self, layers, timeout_ms=None, stats=None):
+        """
+        Executa a consulta única e devolve {nome_da_camada: [linhas]} no mesmo
+        formato de `OverlapService.compute_intersections`. Camadas sem nenhuma
+        intersecção não aparecem no dicionário.
+
+        Com `timeout_ms`, a consulta roda com `statement_timeout` e levanta
+        `OverlapQueryTimeout` se o Postgres a cancelar. `stats`, quando
+        informado, recebe por camada as linhas devolvidas pelo banco, as
+        descartadas aqui e os bytes de geometria (EWKB) lidos.
+        """
+        layers = list(layers)
+        if not layers:
+            return {}
+
+        sql, params = self.build_sql(layers)
+        try:
+            fetched = self._fetch(sql, params, timeout_ms)
+        except OperationalError as exc:
+            if _is_query_canceled(exc):
+                raise OverlapQueryTimeout(layers) from exc
+            raise
+
+        results = {}
+        for (
+            layer_index, _obj_id, attributes, inter_ewkb,
+            inter_area_m2, percent_layer, percent_target,
+        ) in fetched:
+            layer_model = layers[layer_index]
+            if stats is not None:
+                layer_stats = stats.setdefault(layer_model.__name__, {
+                    "rows_returned": 0, "rows_discarded": 0, "geometry_bytes": 0,
+                })
+                layer_stats["rows_returned"] += 1
+                layer_stats["geometry_bytes"] += len(inter_ewkb or b"")
+            obj = self._build_instance(layer_model, attributes)
+            row = self.service._build_result_row(
+                obj,
+                GEOSGeometry(memoryview(inter_ewkb)),
+                layer_model,
+                {
+                    "intersection_area_m2": inter_area_m2 or 0,
+                    "percent_overlap": percent_target or 0,
+                    "percent_overlap_layer": percent_layer or 0,
+                },
+            )
+            if row:
+                results.setdefault(layer_model.__name__, []).append(row)
+            elif stats is not None:
+                layer_stats["rows_discarded"] += 1
+        return results
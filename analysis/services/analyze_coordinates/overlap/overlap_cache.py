@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from kernel.utils import get_layer_versions
+
+# Muda quando o formato das linhas ou as regras de descarte mudam, para não
+# reaproveitar entradas calculadas por uma versão anterior do código.
+CACHE_SCHEMA_VERSION = "1"
+
+
+class _LocalLRU:
+    """LRU em memória do processo (primeiro nível), seguro entre threads."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, max_entries):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+
+_local_cache = _LocalLRU()
+
+
+class OverlapResultCache:
+    """
+    Cache das linhas de sobreposição por camada, em dois níveis: um LRU no
+    processo na frente do cache do Django (Redis).
+
+    A chave combina o hash da geometria normalizada do alvo (e o CAR
+    pesquisado, que muda o resultado do SICAR) com a versão de dados da
+    camada (`kernel.utils.get_layer_versions`). Reimportar ou excluir uma
+    base troca só a versão dela — as entradas das demais camadas continuam
+    válidas, e as antigas simplesmente deixam de ser lidas e expiram.
+
+    Guarda as linhas cruas de `compute_intersections`, antes dos Formatters,
+    para que o painel de colunas continue valendo sobre resultados em cache.
+    """
+
+    def __init__(self, target):
+        self.timeout = getattr(settings, "OVERLAP_CACHE_TIMEOUT", 60 * 60 * 24)
+        self.local_entries = getattr(settings, "OVERLAP_CACHE_LOCAL_ENTRIES", 256)
+        self.target_hash = self._target_hash(target)
+        self._versions = {}
+
+    @staticmethod
+    def _target_hash(target):
+        geom = target.geometry.clone()
+        geom.normalize()
+        car = getattr(target, "car", None)
+        digest = hashlib.sha256(bytes(geom.ewkb))
+        digest.update(f"|car={car.pk if car is not None else ''}".encode())
+        return digest.hexdigest()
+
+    def _key(self, layer_name):
+        version = self._versions[layer_name]
+        return f"overlap:{CACHE_SCHEMA_VERSION}:{layer_name}:{version}:{self.target_hash}"
+
+    def get_many(self, layers):
+        """Devolve {nome_da_camada: linhas} só das camadas encontradas."""
+        self._versions = get_layer_versions(layers)
+        found = {}
+        missing_keys = {}
+        for layer in layers:
+            key = self._key(layer.__name__)
+            rows = _local_cache.get(key)
+            if rows is not None:
+                found[layer.__name__] = rows
+            else:
+                missing_keys[key] = layer.__name__
+
+        if missing_keys:
+            for key, rows in cache.get_many(list(missing_keys)).items():
+                found[missing_keys[key]] = rows
+                _local_cache.set(key, rows, self.local_entries)
+        return found
+
+    def set_many(self, rows_by_layer):
+        entries = {}
+        for layer_name, rows in rows_by_layer.items():
+            key = self._key(layer_name)
+            entries[key] = rows
+            _local_cache.set(key, rows, self.local_entries)
+        if entries:
+            cache.set_many(entries, self.timeout)
@@ -1,18 +1,26 @@
+import time
+
 from django.contrib.gis.geos import GEOSGeometry
-from django.contrib.gis.db.models.functions import Intersection
-from django.db.models import F
 from car_system.models import SicarRecord
 
-UTM_SRID = 31982  # SIRGAS 2000 / UTM 22S
-MIN_INTER_AREA_HA = 0.001  # Descartar intersecções muito pequenas
-SICAR_FULL_OVERLAP_THRESHOLD = 98  # Descartar quando cobre ≥98% do polígono do SICAR
+from analysis.services.analyze_coordinates.overlap.constants import (
+    MIN_INTER_AREA_HA,
+    SICAR_FULL_OVERLAP_THRESHOLD,
+    UTM_SRID,
+)
+from analysis.services.analyze_coordinates.overlap.multi_layer_query import (
+    MultiLayerOverlapQuery,
+    OverlapQueryTimeout,
+)
+from kernel.utils import is_layer_geometry_ready
 
 
 class OverlapService:
     """
     Service responsible for checking overlaps between a geographic target
     (CAR or external polygon) and environmental layers stored in the database.
-    Uses precomputed fields (area_m2, area_ha) for maximum efficiency.
+    Uses precomputed fields (area_m2, area_ha) for maximum efficiency; areas
+    and coverage percentages are computed by PostGIS, not in Python.
     """
 
     def __init__(self, target):
@@ -75,6 +83,10 @@ class OverlapService:
         Aplica regras de descarte:
         - Intersecções muito pequenas
         - Para SICAR, descarta quando a intersecção cobre ≥98% do polígono do SICAR
+
+        O caminho principal já aplica essas regras no SQL
+        (`MultiLayerOverlapQuery._discard_sql`); aqui elas valem para o
+        fallback em texto e como salvaguarda.
         """
         if inter_area_ha < MIN_INTER_AREA_HA:
             return True
@@ -85,78 +97,98 @@ class OverlapService:
     # -----------------------------------------------------------
     # Compute intersections
     # -----------------------------------------------------------
-    def compute_intersections(self, layer_model):
+    def compute_intersections(self, layer_model, timeout_ms=None, stats=None, deadline=None):
         """
         Calcula intersecções entre o alvo e uma camada.
-        1) Usa `usable_geometry` com Intersection (PostGIS)
-        2) Fallback para `geometry` em texto quando necessário
-        """
-        results = self._compute_with_usable_geometry(layer_model)
-        if results:
-            return results
-        return self._compute_with_fallback_geometry(layer_model)
+        1) Usa `usable_geometry` com Intersection (PostGIS), limitada a
+           `timeout_ms` quando informado (`OverlapQueryTimeout` ao estourar);
+           `stats` recebe as estatísticas da consulta (`MultiLayerOverlapQuery`)
+        2) Soma o fallback em texto só para as linhas ainda sem
+           `usable_geometry` — em uma camada pronta (todas as linhas com
+           geometria), um resultado vazio é confiável e vale como vazio. O
+           fallback respeita `deadline` (`time.monotonic()`), com o mesmo
+           `OverlapQueryTimeout` da consulta.
+        """
+        results = self._compute_with_usable_geometry(layer_model, timeout_ms, stats)
+        if not is_layer_geometry_ready(layer_model):
+            results = results + self._compute_with_fallback_geometry(layer_model, deadline)
+        return results
 
-    def _build_result_row(self, obj, inter, layer_model, fallback_geom=None):
+    def _build_result_row(self, obj, inter, layer_model, metrics):
         """
         Constrói o dicionário de saída para uma intersecção válida.
-        Inclui métricas de área e percentuais de cobertura.
+
+        `metrics` traz as métricas já calculadas (pelo PostGIS no caminho
+        principal): `intersection_area_m2`, `percent_overlap` (sobre o alvo)
+        e `percent_overlap_layer` (sobre a feição da camada).
         """
-        inter_utm = inter.transform(UTM_SRID, clone=True)
-        inter_area_m2 = inter_utm.area
+        inter_area_m2 = metrics["intersection_area_m2"]
         inter_area_ha = inter_area_m2 / 10000
-
-        layer_area_m2 = self._get_layer_area_m2(obj, fallback_geom=fallback_geom)
-        percent_overlap_layer = self._compute_percent_overlap_layer(inter_area_m2, layer_area_m2)
+        percent_overlap_layer = metrics["percent_overlap_layer"]
 
         if self._should_discard(layer_model, inter_area_ha, percent_overlap_layer):
             return None
 
-        percent_overlap_target = self._compute_percent_overlap_target(inter_area_m2)
-
         return {
             "id": obj.id,
             "instance": obj,
             "intersection_area_m2": inter_area_m2,
             "intersection_area_ha": inter_area_ha,
-            "percent_overlap": percent_overlap_target,
+            "percent_overlap": metrics["percent_overlap"],
             "percent_overlap_layer": percent_overlap_layer,
             "layer_area_ha": getattr(obj, "area_ha", None),
             "target_area_ha": self.target_area_ha,
             "intersection_geom": inter,
         }
 
-    def _compute_with_usable_geometry(self, layer_model):
+    def _compute_with_usable_geometry(self, layer_model, timeout_ms=None, stats=None):
         """
-        Caminho principal: usa `usable_geometry` e a função `Intersection` para
-        calcular intersecções diretamente via banco (PostGIS).
+        Caminho principal: usa `usable_geometry` e calcula intersecção, área
+        (em UTM) e percentuais diretamente no PostGIS — o Python só lê números.
+        Compartilha o SQL do modo de consulta única (`MultiLayerOverlapQuery`).
         """
-        qs = (
-            layer_model.objects
-            .filter(usable_geometry__intersects=self.target_geom)
-            .annotate(intersection=Intersection(F("usable_geometry"), self.target_geom))
+        results = MultiLayerOverlapQuery(self).execute(
+            [layer_model], timeout_ms=timeout_ms, stats=stats
         )
+        return results.get(layer_model.__name__, [])
 
-        results = []
-        for obj in qs:
-            inter = obj.intersection
-            if inter.empty:
-                continue
-            row = self._build_result_row(obj, inter, layer_model)
-            if row:
-                results.append(row)
-        return results
+    def _bbox_overlaps(self, geom):
+        """
+        Pré-filtro barato por bounding box, antes do `buffer(0)` e da
+        intersecção em GEOS.
+        """
+        xmin, ymin, xmax, ymax = geom.extent
+        txmin, tymin, txmax, tymax = self.target_geom.extent
+        return xmin <= txmax and txmin <= xmax and ymin <= tymax and tymin <= ymax
 
-    def _compute_with_fallback_geometry(self, layer_model):
+    def _compute_with_fallback_geometry(self, layer_model, deadline=None):
         """
-        Caminho de fallback: quando não há `usable_geometry`, utiliza `geometry`
-        em texto, normaliza SRID e calcula intersecção no app.
+        Caminho de fallback: para as linhas sem `usable_geometry` (ex.: WKT
+        que falhou na importação), utiliza `geometry` em texto, normaliza SRID
+        e calcula intersecção no app. Linhas com `usable_geometry` já foram
+        avaliadas pelo caminho principal e nunca são relidas aqui.
+
+        Passado `deadline` (`time.monotonic()`), para com
+        `OverlapQueryTimeout`: a camada fica sem avaliação em vez de segurar
+        a busca.
         """
+        if deadline is not None and time.monotonic() >= deadline:
+            raise OverlapQueryTimeout([layer_model])
+        qs = layer_model.objects.filter(usable_geometry__isnull=True).exclude(geometry__isnull=True)
+        car = getattr(self.target, "car", None)
+        if layer_model is SicarRecord and car is not None:
+            qs = qs.exclude(pk=car.pk)
+
         results = []
-        for obj in layer_model.objects.exclude(geometry__isnull=True):
+        for obj in qs.iterator(chunk_size=500):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise OverlapQueryTimeout([layer_model])
             try:
                 geom = GEOSGeometry(getattr(obj, "geometry"), srid=4674)
             except Exception:
                 continue
+            if geom.empty or not self._bbox_overlaps(geom):
+                continue
             if not geom.valid:
                 try:
                     geom = geom.buffer(0)
@@ -166,10 +198,15 @@ class OverlapService:
             if inter.empty:
                 continue
             try:
-                _ = inter.transform(UTM_SRID, clone=True)
+                inter_area_m2 = inter.transform(UTM_SRID, clone=True).area
             except Exception:
                 continue
-            row = self._build_result_row(obj, inter, layer_model, fallback_geom=geom)
+            layer_area_m2 = self._get_layer_area_m2(obj, fallback_geom=geom)
+            row = self._build_result_row(obj, inter, layer_model, {
+                "intersection_area_m2": inter_area_m2,
+                "percent_overlap": self._compute_percent_overlap_target(inter_area_m2),
+                "percent_overlap_layer": self._compute_percent_overlap_layer(inter_area_m2, layer_area_m2),
+            })
             if row:
                 results.append(row)
         return results
@@ -1,29 +1,285 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from analysis.services.analyze_coordinates.overlap.layer_metrics import (
+    STATUS_CACHED,
+    STATUS_NOT_EVALUATED,
+    LayerMetrics,
+)
+from analysis.services.analyze_coordinates.overlap.multi_layer_query import (
+    MultiLayerOverlapQuery,
+    OverlapQueryTimeout,
+)
+from analysis.services.analyze_coordinates.overlap.overlap_cache import OverlapResultCache
 from analysis.services.analyze_coordinates.overlap.overlap_service import OverlapService
+from kernel.utils import is_layer_geometry_ready
+
+MODE_SEQUENTIAL = "sequential"
+MODE_SINGLE_QUERY = "single_query"
+MODE_PARALLEL = "parallel"
+
+
+class SearchBudget:
+    """
+    Limites de tempo de uma busca: cada consulta ao banco roda com
+    `statement_timeout` de até `layer_timeout_ms`, sem passar do que resta de
+    `search_timeout_ms` (contado a partir da criação). Zero/None desliga o
+    limite correspondente.
+    """
+
+    def __init__(self, layer_timeout_ms=None, search_timeout_ms=None):
+        self.layer_timeout_ms = layer_timeout_ms or None
+        self.deadline = (
+            time.monotonic() + search_timeout_ms / 1000 if search_timeout_ms else None
+        )
+
+    def exhausted(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def layer_deadline(self):
+        """Instante (`time.monotonic()`) até o qual uma camada que começa
+        agora pode rodar — usado no fallback em texto, que roda no Python e
+        não tem `statement_timeout` —, ou None para sem limite."""
+        deadline = self.deadline
+        if self.layer_timeout_ms is not None:
+            layer_deadline = time.monotonic() + self.layer_timeout_ms / 1000
+            deadline = layer_deadline if deadline is None else min(deadline, layer_deadline)
+        return deadline
+
+    def statement_timeout(self):
+        """Timeout (ms) da próxima consulta, ou None para sem limite."""
+        timeout = self.layer_timeout_ms
+        if self.deadline is not None:
+            remaining = max(1, int((self.deadline - time.monotonic()) * 1000))
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
 
 
 class OverlapPipeline:
     """
     Pipeline responsible for orchestrating overlap computation
     and applying formatters to each environmental layer.
+
+    Modos de execução (`settings.OVERLAP_EXECUTION_MODE`):
+    - "single_query": todas as camadas em um único `UNION ALL` no PostGIS
+      (um round trip por busca, em vez de um por camada).
+    - "parallel": uma consulta por camada, várias ao mesmo tempo em um pool
+      de threads limitado (`settings.OVERLAP_MAX_WORKERS`); o tempo total
+      fica próximo ao da camada mais lenta.
+    - "sequential": uma consulta por camada, uma após a outra.
+
+    Com `settings.OVERLAP_CACHE_ENABLED`, as linhas de cada camada são lidas
+    antes de `OverlapResultCache` e só as camadas ausentes vão ao banco.
+
+    Cada consulta roda dentro do `SearchBudget` da busca
+    (`settings.OVERLAP_LAYER_TIMEOUT_MS` por consulta e
+    `settings.OVERLAP_SEARCH_TIMEOUT_MS` para a busca inteira). Uma camada
+    cuja consulta é cancelada, ou que fica para depois do prazo da busca,
+    volta como None ("não avaliada") e o restante do resultado segue normal.
+    No modo "single_query", o `UNION ALL` recebe o limite de uma consulta; se
+    estourar, as camadas são refeitas uma a uma para isolar a que travou.
+
+    `on_layer_done(nome_da_camada, linhas)`, quando informado, é chamado
+    assim que cada camada termina, já com as linhas formatadas — usado para
+    publicar o progresso e os resultados parciais das buscas em background.
+    As camadas de `priority` (nomes) são calculadas antes das demais; no
+    modo "single_query" com `on_layer_done`, elas vão em uma consulta
+    própria, para que cheguem antes da consulta com o restante.
+
+    `metrics` (`LayerMetrics`), quando informado, recebe a instrumentação
+    por camada: tempo e número de consultas, linhas, bytes de geometria e
+    tempo dos Formatters.
     """
 
-    def run(self, target, layers, formatters):
+    def __init__(self, mode=None, max_workers=None, use_cache=None,
+                 layer_timeout_ms=None, search_timeout_ms=None):
+        self.mode = mode or getattr(settings, "OVERLAP_EXECUTION_MODE", MODE_SINGLE_QUERY)
+        self.max_workers = max_workers or getattr(settings, "OVERLAP_MAX_WORKERS", 4)
+        if use_cache is None:
+            use_cache = getattr(settings, "OVERLAP_CACHE_ENABLED", True)
+        self.use_cache = use_cache
+        if layer_timeout_ms is None:
+            layer_timeout_ms = getattr(settings, "OVERLAP_LAYER_TIMEOUT_MS", 0)
+        if search_timeout_ms is None:
+            search_timeout_ms = getattr(settings, "OVERLAP_SEARCH_TIMEOUT_MS", 0)
+        self.layer_timeout_ms = layer_timeout_ms
+        self.search_timeout_ms = search_timeout_ms
+
+    def run(self, target, layers, formatters, on_layer_done=None, priority=(), metrics=None):
         service = OverlapService(target)
-        result = {}
+        budget = SearchBudget(self.layer_timeout_ms, self.search_timeout_ms)
+        metrics = metrics if metrics is not None else LayerMetrics()
 
         for layer in layers:
-            layer_name = layer.__name__
+            if formatters.get(layer) is None:
+                raise ValueError(f"No formatter registered for layer: {layer.__name__}")
+
+        priority = set(priority or ())
+        layers_by_name = {layer.__name__: layer for layer in layers}
+        formatted = {}
+
+        # O objeto já vem carregado em `row["instance"]` (calculado durante
+        # a intersecção no banco) — evita um SELECT extra por resultado.
+        def done(layer_name, rows):
+            formatter = formatters[layers_by_name[layer_name]]
+            if rows is None:
+                metrics.add(layer_name, status=STATUS_NOT_EVALUATED)
+                formatted[layer_name] = None
+            else:
+                with metrics.measure_formatter(layer_name):
+                    formatted[layer_name] = [
+                        formatter.format(row["instance"], row) for row in rows
+                    ]
+            if on_layer_done is not None:
+                on_layer_done(layer_name, formatted[layer_name])
 
-            formatter = formatters.get(layer)
-            if formatter is None:
-                raise ValueError(f"No formatter registered for layer: {layer_name}")
+        scheduled = (
+            [layer for layer in layers if layer.__name__ in priority]
+            + [layer for layer in layers if layer.__name__ not in priority]
+        )
+        split = priority if on_layer_done is not None else set()
 
-            rows = service.compute_intersections(layer)
+        if self.use_cache:
+            result_cache = OverlapResultCache(target)
+            cached = result_cache.get_many(scheduled)
+            for layer in scheduled:
+                if layer.__name__ in cached:
+                    metrics.add(layer.__name__, status=STATUS_CACHED)
+                    done(layer.__name__, cached[layer.__name__])
+            missing = [layer for layer in scheduled if layer.__name__ not in cached]
+            if missing:
+                computed = self._compute(service, missing, done, budget, metrics, split)
+                # Camadas sem intersecção também entram no cache (lista
+                # vazia); as não avaliadas ficam de fora.
+                result_cache.set_many({
+                    layer.__name__: computed.get(layer.__name__, []) for layer in missing
+                    if formatted.get(layer.__name__) is not None
+                })
+        else:
+            self._compute(service, scheduled, done, budget, metrics, split)
 
-            # O objeto já vem carregado em `row["instance"]` (calculado durante
-            # a intersecção no banco) — evita um SELECT extra por resultado.
-            result[layer_name] = [
-                formatter.format(row["instance"], row) for row in rows
+        return {layer.__name__: formatted.get(layer.__name__) for layer in layers}
+
+    def _compute(self, service, layers, done, budget, metrics, split=()):
+        if self.mode == MODE_SINGLE_QUERY:
+            first = [layer for layer in layers if layer.__name__ in split]
+            rest = [layer for layer in layers if layer.__name__ not in split]
+            if first and rest:
+                rows_by_layer = self._compute_single_query(service, first, done, budget, metrics)
+                rows_by_layer.update(self._compute_single_query(service, rest, done, budget, metrics))
+                return rows_by_layer
+            return self._compute_single_query(service, layers, done, budget, metrics)
+        if self.mode == MODE_PARALLEL:
+            return self._compute_parallel(service, layers, done, budget, metrics)
+        return self._compute_sequential(service, layers, done, budget, metrics)
+
+    @staticmethod
+    def _compute_layer(service, layer, budget, metrics):
+        """Linhas de uma camada, ou None se ela ficou sem avaliação."""
+        if budget.exhausted():
+            return None
+        stats = {}
+        try:
+            with metrics.measure_query([layer.__name__]):
+                return service.compute_intersections(
+                    layer, timeout_ms=budget.statement_timeout(), stats=stats,
+                    deadline=budget.layer_deadline(),
+                )
+        except OverlapQueryTimeout:
+            return None
+        finally:
+            metrics.add_query_stats(stats)
+
+    def _compute_sequential(self, service, layers, done, budget, metrics):
+        rows_by_layer = {}
+        for layer in layers:
+            rows = self._compute_layer(service, layer, budget, metrics)
+            if rows is not None:
+                rows_by_layer[layer.__name__] = rows
+            done(layer.__name__, rows)
+        return rows_by_layer
+
+    def _compute_parallel(self, service, layers, done, budget, metrics):
+        """
+        Distribui as camadas entre `max_workers` threads. Cada thread consome
+        camadas de uma fila compartilhada usando a sua própria conexão (o
+        Django mantém uma conexão por thread) e a fecha ao terminar, para não
+        deixar conexões órfãs no Postgres. O resultado é montado na ordem
+        original das camadas.
+        """
+        pending = deque(layers)
+        rows_by_layer = {}
+        workers = max(1, min(self.max_workers, len(layers)))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="overlap") as executor:
+            futures = [
+                executor.submit(
+                    self._parallel_worker, service, pending, rows_by_layer, done, budget, metrics
+                )
+                for _ in range(workers)
             ]
+            for future in futures:
+                future.result()
+
+        return {
+            layer.__name__: rows_by_layer[layer.__name__]
+            for layer in layers if layer.__name__ in rows_by_layer
+        }
+
+    @classmethod
+    def _parallel_worker(cls, service, pending, rows_by_layer, done, budget, metrics):
+        try:
+            while True:
+                try:
+                    layer = pending.popleft()
+                except IndexError:
+                    return
+                rows = cls._compute_layer(service, layer, budget, metrics)
+                if rows is not None:
+                    rows_by_layer[layer.__name__] = rows
+                done(layer.__name__, rows)
+        finally:
+            connections.close_all()
 
-        return result
+    def _compute_single_query(self, service, layers, done, budget, metrics):
+        if budget.exhausted():
+            for layer in layers:
+                done(layer.__name__, None)
+            return {}
+        stats = {}
+        try:
+            with metrics.measure_query([layer.__name__ for layer in layers]):
+                rows_by_layer = MultiLayerOverlapQuery(service).execute(
+                    layers, timeout_ms=budget.statement_timeout(), stats=stats
+                )
+        except OverlapQueryTimeout:
+            # Não há como saber qual ramo do UNION ALL travou: refaz camada a
+            # camada, e só as que estourarem o próprio limite ficam sem avaliação.
+            return self._compute_sequential(service, layers, done, budget, metrics)
+        metrics.add_query_stats(stats)
+        not_evaluated = set()
+
+        # Mesmo contrato de `compute_intersections`: só camadas que ainda têm
+        # linhas sem `usable_geometry` passam pelo fallback em texto, dentro
+        # do limite da camada e da busca.
+        for layer in layers:
+            if is_layer_geometry_ready(layer):
+                continue
+            try:
+                rows_by_layer[layer.__name__] = (
+                    rows_by_layer.get(layer.__name__, [])
+                    + service._compute_with_fallback_geometry(layer, budget.layer_deadline())
+                )
+            except OverlapQueryTimeout:
+                rows_by_layer.pop(layer.__name__, None)
+                not_evaluated.add(layer.__name__)
+        for layer in layers:
+            if layer.__name__ in not_evaluated:
+                done(layer.__name__, None)
+            else:
+                done(layer.__name__, rows_by_layer.get(layer.__name__, []))
+        return rows_by_layer
@@ -1,12 +1,20 @@
 import json
 import time
+from contextlib import nullcontext
 
 from django.conf import settings
 
-from analysis.services.analyze_coordinates.overlap.final_result_builder import FinalResultBuilder
+from analysis.models import format_duration
+from analysis.services.analyze_coordinates.overlap.final_result_builder import (
+    FinalResultBuilder,
+    base_name,
+)
 from analysis.services.analyze_coordinates.overlap.formatter_register import FormatterRegister
 from analysis.services.analyze_coordinates.overlap.geometry_target import GeometryTarget
-from analysis.services.analyze_coordinates.overlap.pipeline import OverlapPipeline
+from analysis.services.analyze_coordinates.overlap.layer_metrics import LayerMetrics
+from analysis.services.analyze_coordinates.overlap.pipeline import MODE_SEQUENTIAL, OverlapPipeline
+from analysis.services.view_services.search_metrics import SearchMetrics
+from analysis.templatetags.report_extras import base_severity
 
 
 class SearchAll:
@@ -15,43 +23,68 @@ class SearchAll:
     - Preparing the geometry target (CAR or external polygon)
     - Executing the overlap pipeline
     - Building the final structured response for the UI
-    - Tracking performance (timing each step)
+    - Tracking performance (timing each step and, per layer, query time,
+      rows, geometry bytes, formatter time and SQL queries)
     """
 
-    def __init__(self):
-        self.pipeline = OverlapPipeline()
+    def __init__(self, profiler=None):
+        """
+        `profiler` (`SearchProfiler`), quando informado, liga o modo de
+        perfil: a busca roda sob o profiler, com uma consulta por camada
+        ("sequential") e sem o cache de sobreposição, para que cada camada
+        tenha o próprio SQL e EXPLAIN.
+        """
+        self.profiler = profiler
+        if profiler is not None:
+            self.pipeline = OverlapPipeline(mode=MODE_SEQUENTIAL, use_cache=False)
+        else:
+            self.pipeline = OverlapPipeline()
         self.builder = FinalResultBuilder()
         self.formatters = FormatterRegister()
 
-    def execute(self, geometry_or_car):
+    def execute(self, geometry_or_car, on_layer_done=None):
         """
         Executa o fluxo completo de análise de sobreposição
         e retorna um dicionário pronto para uso na UI.
+
+        `on_layer_done(nome_da_camada, linhas)` é repassado ao pipeline para
+        acompanhar o progresso e os resultados por camada (buscas em
+        background); as bases críticas (`base_severity`) são calculadas
+        primeiro.
         """
 
         performance = {}
-
-        # 1) Preparar alvo e tipo de entrada
-        t0 = time.perf_counter()
-        target, input_type = self._create_target_and_type(geometry_or_car)
-        performance["input_type"] = input_type
-        performance["time_target_creation"] = time.perf_counter() - t0
-
-        # 2) Executar pipeline de sobreposição nas camadas
-        t1 = time.perf_counter()
-        layers = self._get_layers()
-        pipeline_result = self._run_pipeline(target, layers)
-        performance["time_pipeline_total"] = time.perf_counter() - t1
-
-        # 3) Construir saída final estruturada
-        t2 = time.perf_counter()
-        final_output = self._build_final_output(target, pipeline_result, layers)
-        performance["time_builder"] = time.perf_counter() - t2
+        capture = self.profiler.capture() if self.profiler is not None else nullcontext()
+
+        with capture:
+            # 1) Preparar alvo e tipo de entrada
+            t0 = time.perf_counter()
+            target, input_type = self._create_target_and_type(geometry_or_car)
+            performance["input_type"] = input_type
+            performance["time_target_creation"] = time.perf_counter() - t0
+
+            # 2) Executar pipeline de sobreposição nas camadas
+            t1 = time.perf_counter()
+            layers = self._get_layers()
+            layer_metrics = LayerMetrics()
+            pipeline_result = self._run_pipeline(target, layers, on_layer_done, layer_metrics)
+            performance["time_pipeline_total"] = time.perf_counter() - t1
+            performance["layers"] = layer_metrics.as_dict()
+            performance["sql_queries"] = layer_metrics.sql_queries
+
+            # 3) Construir saída final estruturada
+            t2 = time.perf_counter()
+            final_output = self._build_final_output(target, pipeline_result, layers)
+            performance["time_builder"] = time.perf_counter() - t2
 
         # 4) Medir tempo total e anexar à saída
         total_seconds = time.perf_counter() - t0
         performance["time_total"] = total_seconds
         self._attach_timing_to_output(final_output, performance, total_seconds)
+        self._record_metrics(performance)
+        if self.profiler is not None:
+            # Fora da captura: os EXPLAIN não entram no tempo nem no perfil.
+            self.profiler.explain()
 
         # 5) Persistir log de performance para depuração (só em DEBUG: em
         # produção isso é I/O síncrono por busca, com nome de arquivo fixo
@@ -83,7 +116,17 @@ class SearchAll:
         """
         return list(self.formatters.formatters.keys())
 
-    def _run_pipeline(self, target, layers):
+    def _priority_layers(self, layers):
+        """
+        Camadas das bases críticas (embargos, PRODES, MapBiomas), que o
+        pipeline agenda antes das demais.
+        """
+        return [
+            layer.__name__ for layer in layers
+            if base_severity(base_name(layer.__name__)) == "critical"
+        ]
+
+    def _run_pipeline(self, target, layers, on_layer_done=None, metrics=None):
         """
         Executa o pipeline de sobreposição e retorna o mapa de resultados por camada.
         """
@@ -91,6 +134,9 @@ class SearchAll:
             target=target,
             layers=layers,
             formatters=self.formatters.formatters,
+            on_layer_done=on_layer_done,
+            priority=self._priority_layers(layers),
+            metrics=metrics,
         )
 
     def _build_final_output(self, target, pipeline_result, layers):
@@ -103,26 +149,26 @@ class SearchAll:
             layers=layers,
         )
 
-    def _format_seconds(self, s):
-        """
-        Formata segundos em uma string amigável (ms, s, m s).
-        """
-        if s < 1:
-            return f"{int(s * 1000)} ms"
-        if s < 60:
-            return f"{s:.2f} s"
-        m = int(s // 60)
-        sec = s % 60
-        return f"{m}m {sec:.1f}s"
-
     def _attach_timing_to_output(self, final_output, performance, total_seconds):
         """
         Anexa métricas de tempo ao dicionário final emitido para a UI.
         """
         final_output["tempo_execucao_segundos"] = total_seconds
-        final_output["tempo_execucao_formatado"] = self._format_seconds(total_seconds)
+        final_output["tempo_execucao_formatado"] = format_duration(total_seconds)
         final_output["performance"] = performance
 
+    def _record_metrics(self, performance):
+        """
+        Soma a busca às métricas do Prometheus (/metrics). Falhas (ex.: Redis
+        fora do ar) nunca interrompem a busca.
+        """
+        if not getattr(settings, "METRICS_ENABLED", True):
+            return
+        try:
+            SearchMetrics().record(performance)
+        except Exception:
+            pass
+
     def _save_performance_log(self, performance):
         """
         Persiste o log de performance em disco para depuração.
@@ -5,7 +5,7 @@ from .search_all import SearchAll
 
 class SearchForCar:
     
-    def execute(self, car: str) -> dict:
+    def execute(self, car: str, on_layer_done=None, profiler=None) -> dict:
         car_norm = (car or "").strip()
         qs = get_sicar_record(car_number__iexact=car_norm)
         if not qs.exists():
@@ -20,4 +20,4 @@ class SearchForCar:
             except Exception:
                 return {}
             obj.usable_geometry = geom
-        return SearchAll().execute(obj)
+        return SearchAll(profiler=profiler).execute(obj, on_layer_done=on_layer_done)
@@ -0,0 +1,103 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+# Consultas de sobreposição (`MultiLayerOverlapQuery.build_sql`): só elas
+# ganham EXPLAIN; o resto (contagens, cache de versões) só é listado.
+_OVERLAP_SQL_PREFIX = "WITH alvo AS"
+
+# Quantas funções do cProfile entram no relatório.
+PROFILE_TOP_FUNCTIONS = 60
+
+
+def _describe_param(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<EWKB {len(value)} bytes>"
+    return repr(value)
+
+
+class SearchProfiler:
+    """
+    Modo de perfil de uma busca (`?profile=1`, só para staff).
+
+    `capture()` roda o trecho sob o cProfile (determinístico) e registra
+    todas as consultas SQL da conexão, com tempo e parâmetros. Depois,
+    `explain()` refaz cada consulta de sobreposição com
+    `EXPLAIN (ANALYZE, BUFFERS)` — respeitando o mesmo `statement_timeout`
+    das buscas — e `bundle()` devolve o pacote gravado em `SearchProfile`.
+
+    Para que cada camada tenha a própria consulta (e o próprio plano), o
+    `SearchAll` em modo de perfil usa o pipeline "sequential" e ignora o
+    cache de sobreposição.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._profile = cProfile.Profile()
+
+    def _record(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "sql": sql,
+                "params": params,
+                "time": time.perf_counter() - t0,
+            })
+
+    @contextmanager
+    def capture(self):
+        with connection.execute_wrapper(self._record):
+            self._profile.enable()
+            try:
+                yield
+            finally:
+                self._profile.disable()
+
+    def _explain(self, sql, params):
+        timeout_ms = getattr(settings, "OVERLAP_LAYER_TIMEOUT_MS", 0)
+        try:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    if timeout_ms:
+                        cursor.execute(
+                            "SELECT set_config('statement_timeout', %s, true)", [str(int(timeout_ms))]
+                        )
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                    return "\n".join(row[0] for row in cursor.fetchall())
+        except DatabaseError as exc:
+            return f"EXPLAIN falhou: {exc}"
+
+    def explain(self):
+        """Anexa o plano executado a cada consulta de sobreposição."""
+        for query in self.queries:
+            if query["sql"].lstrip().startswith(_OVERLAP_SQL_PREFIX):
+                query["explain"] = self._explain(query["sql"], query["params"])
+
+    def _profile_text(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return out.getvalue()
+
+    def bundle(self, performance=None):
+        """Pacote do perfil (JSON): cProfile, consultas e `performance`."""
+        return {
+            "performance": performance or {},
+            "cprofile": self._profile_text(),
+            "queries": [
+                {
+                    "sql": query["sql"],
+                    "params": [_describe_param(p) for p in (query["params"] or [])],
+                    "time": query["time"],
+                    "explain": query.get("explain"),
+                }
+                for query in self.queries
+            ],
+        }
@@ -0,0 +1,139 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from analysis.services.analyze_coordinates.overlap.final_result_builder import base_name
+from analysis.templatetags.report_extras import base_severity
+
+STATUS_PENDING = "pendente"
+STATUS_RUNNING = "executando"
+STATUS_DONE = "concluido"
+STATUS_ERROR = "erro"
+
+JOB_TIMEOUT_MESSAGE = "A análise excedeu o tempo limite. Tente novamente mais tarde."
+
+
+class AnalysisJobStore:
+    """
+    Estado das buscas executadas em background (`run_analysis_job`), no
+    cache do Django (Redis), lido pela página de espera por polling.
+
+    Cada job guarda o dono (`user_id`), o status, o progresso por camada
+    (`camadas_total`/`camadas_concluidas`, na ordem em que terminaram) e, ao
+    terminar, o id do resultado no `ResultStore` ou a mensagem de erro. As
+    linhas de cada camada concluída ficam em uma chave própria, enviadas à
+    página de espera pelo polling do status (`AnalysisJobStatusView`).
+
+    Um job morto pelo tempo limite rígido (`ANALYSIS_JOB_HARD_TIME_LIMIT`)
+    não chega a gravar o erro: passado esse tempo desde o início
+    (`iniciado_em`), `get` o marca como erro, para a página de espera não
+    ficar esperando para sempre.
+    """
+
+    key_prefix = "analysis_job"
+
+    def __init__(self):
+        self.timeout = getattr(settings, "ANALYSIS_RESULT_TTL", 60 * 60 * 24)
+
+    def _key(self, job_id):
+        return f"{self.key_prefix}:{job_id}"
+
+    def create(self, user_id, kind):
+        job_id = uuid.uuid4().hex
+        cache.set(self._key(job_id), {
+            "id": job_id,
+            "user_id": user_id,
+            "tipo": kind,
+            "status": STATUS_PENDING,
+            "camadas_total": 0,
+            "camadas_concluidas": [],
+            "result_id": None,
+            "erro": None,
+        }, self.timeout)
+        return job_id
+
+    def get(self, job_id):
+        job = cache.get(self._key(job_id))
+        if job and job.get("status") == STATUS_RUNNING and self._killed(job):
+            job = self.update(job_id, status=STATUS_ERROR, erro=JOB_TIMEOUT_MESSAGE)
+        return job
+
+    @staticmethod
+    def _killed(job):
+        started = job.get("iniciado_em")
+        limit = getattr(settings, "ANALYSIS_JOB_HARD_TIME_LIMIT", 16 * 60)
+        # Folga para o worker registrar o fim de um job que terminou no limite.
+        return started is not None and time.time() - started > limit + 30
+
+    def set_layer_result(self, job_id, layer_name, payload):
+        cache.set(f"{self._key(job_id)}:camada:{layer_name}", payload, self.timeout)
+
+    def get_layer_result(self, job_id, layer_name):
+        return cache.get(f"{self._key(job_id)}:camada:{layer_name}")
+
+    def update(self, job_id, **fields):
+        job = cache.get(self._key(job_id)) or {"id": job_id}
+        job.update(fields)
+        cache.set(self._key(job_id), job, self.timeout)
+        return job
+
+
+# Colunas de geometria não vão para a página de espera: ela mostra
+# só a tabela; o mapa usa o resultado completo, ao final.
+_PROGRESS_EXCLUDED_KEYS = {"polygon_wkt", "polygon_geojson"}
+
+
+def layer_result_payload(layer_name, rows):
+    """Resumo de uma camada concluída, como enviado ao navegador. `rows`
+    None indica camada não avaliada (tempo limite da consulta)."""
+    nome_base = base_name(layer_name)
+    nao_avaliado = rows is None
+    rows = rows or []
+    return {
+        "camada": layer_name,
+        "nome_base": nome_base,
+        "severidade": base_severity(nome_base),
+        "nao_avaliado": nao_avaliado,
+        "total_areas_com_sobreposicao": len(rows),
+        "total_area": sum(float(r.get("area") or 0) for r in rows),
+        "areas_encontradas": [
+            {k: v for k, v in r.items() if k not in _PROGRESS_EXCLUDED_KEYS}
+            for r in rows
+        ],
+    }
+
+
+class JobProgress:
+    """
+    Callback `on_layer_done` que publica o progresso de um job e as linhas
+    de cada camada concluída. O processo do worker é o único que escreve o
+    estado do job; o lock só serializa as threads do modo "parallel" do
+    pipeline.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self._done = []
+        self._lock = threading.Lock()
+
+    def start(self, total_layers):
+        self.store.update(
+            self.job_id, status=STATUS_RUNNING, iniciado_em=time.time(),
+            camadas_total=total_layers, camadas_concluidas=[],
+        )
+
+    def __call__(self, layer_name, rows=()):
+        with self._lock:
+            if layer_name in self._done:
+                return
+            # A camada é gravada antes de entrar em `camadas_concluidas`:
+            # quem lê a lista sempre encontra as linhas.
+            self.store.set_layer_result(
+                self.job_id, layer_name, layer_result_payload(layer_name, rows)
+            )
+            self._done.append(layer_name)
+            self.store.update(self.job_id, camadas_concluidas=list(self._done))
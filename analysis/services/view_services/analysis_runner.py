@@ -0,0 +1,120 @@
+from dataclasses import asdict
+
+from celery.exceptions import SoftTimeLimitExceeded
+
+from analysis.models import SearchHistory
+from analysis.services.analyze_coordinates.search_all import SearchAll
+from analysis.services.analyze_coordinates.search_for_car import SearchForCar
+from car_system.utils import get_sicar_record
+from doc_extractor.services.parsers.context.extract_data_context import DocumentDataContext
+from doc_extractor.services.parsers.factory.documents_parser_factory import DocumentsParserFactory
+from doc_extractor.services.parsers.implement.extract_text.extract_pdf_plumber import (
+    ExtractDocumentPdfPlumber,
+)
+from kernel.utils import locate_city_state
+
+DOC_SEARCH_TYPE = {
+    'demonstrativo': SearchHistory.SearchType.DEMONSTRATIVO,
+    'recibo': SearchHistory.SearchType.RECIBO,
+}
+
+
+class AnalysisRunner:
+    """
+    Executa cada tipo de busca (CAR, geometria, PDF do CAR) e monta o dict
+    de análise usado por resultados/relatório/histórico.
+
+    Compartilhado pelas views (execução síncrona) e pelo worker Celery
+    (`run_analysis_job`), para que os dois caminhos produzam exatamente o
+    mesmo resultado. Erros sobem como exceção; cada chamador decide como
+    apresentá-los. O tempo limite do job (`SoftTimeLimitExceeded`) sempre
+    sobe, mesmo nos trechos que toleram falhas.
+
+    Com `profiler` (`SearchProfiler`), a busca roda em modo de perfil; o
+    pacote sai de `profiler.bundle()` depois da execução.
+    """
+
+    def __init__(self, on_layer_done=None, profiler=None):
+        self.on_layer_done = on_layer_done
+        self.profiler = profiler
+
+    def _car_data(self, car_number):
+        """Busca dados do CAR e localidade."""
+        resultado = {}
+        municipio, state = None, None
+
+        if car_number:
+            try:
+                resultado = SearchForCar().execute(
+                    car_number, on_layer_done=self.on_layer_done, profiler=self.profiler
+                ) or {}
+                qs = get_sicar_record(car_number__iexact=car_number)
+                if qs.exists():
+                    geometry = qs.first().geometry
+                    municipio, state = locate_city_state(geometry)
+            except SoftTimeLimitExceeded:
+                # Tempo limite do job (`run_analysis_job`): não pode virar um
+                # resultado vazio ("sem sobreposições").
+                raise
+            except Exception:
+                pass
+        return resultado, municipio, state
+
+    def by_car(self, car_input):
+        resultado, municipio, state = self._car_data(car_input)
+        return {
+            'resultado': resultado,
+            'car_input': car_input,
+            'municipio': municipio,
+            'uf': state,
+            'sucesso': True
+        }
+
+    def by_document(self, file_obj, doc_type, result_key, car_input):
+        """Lê o PDF (Recibo ou Demonstrativo) e analisa o CAR encontrado nele."""
+        parser = DocumentsParserFactory.create_parser(doc_type)
+        extractor = ExtractDocumentPdfPlumber()
+        ctx = DocumentDataContext(extractor, parser)
+        info = ctx.extract_data(file_obj)
+
+        car_extraido = (info.car or car_input or '').strip()
+        resultado, municipio, state = self._car_data(car_extraido)
+        return {
+            'resultado': resultado,
+            result_key: asdict(info),
+            'car_input': car_extraido,
+            'municipio': municipio,
+            'uf': state,
+            'sucesso': True
+        }
+
+    def by_geometry(self, coordenadas_input, car_input):
+        resultado = SearchAll(profiler=self.profiler).execute(
+            coordenadas_input, on_layer_done=self.on_layer_done
+        )
+
+        municipio, uf = None, None
+        try:
+            municipio, uf = locate_city_state(coordenadas_input)
+        except SoftTimeLimitExceeded:
+            raise
+        except Exception:
+            pass
+
+        return {
+            'resultado': resultado,
+            'coordenadas_recebidas': coordenadas_input,
+            'car_input': car_input,
+            'municipio': municipio,
+            'uf': uf,
+            'sucesso': True
+        }
+
+    @staticmethod
+    def geometry_error(coordenadas_input, car_input, exc):
+        return {
+            'erro': f'Erro ao processar coordenadas: {str(exc)}',
+            'coordenadas_recebidas': coordenadas_input,
+            'car_input': car_input,
+            'sucesso': False
+        }
@@ -0,0 +1,93 @@
+import json
+
+from django.contrib.gis.geos import GEOSGeometry
+
+# Casas decimais mantidas nas coordenadas enviadas ao mapa. Em graus (SRID
+# 4674), 6 casas equivalem a ~0,1 m — abaixo de qualquer pixel do Leaflet.
+COORDINATE_DECIMALS = 6
+
+# Níveis de detalhe (LOD) das geometrias exibidas: até `max_zoom`, o mapa usa
+# a versão simplificada com `tolerance` (graus); acima do último nível usa a
+# geometria completa. Tolerâncias próximas de 1 pixel em cada faixa de zoom.
+LOD_LEVELS = (
+    {"max_zoom": 10, "tolerance": 0.001},
+    {"max_zoom": 13, "tolerance": 0.0001},
+    {"max_zoom": 15, "tolerance": 0.00002},
+)
+
+
+def _quantize(coords, decimals):
+    if isinstance(coords, (list, tuple)):
+        if coords and isinstance(coords[0], (int, float)):
+            return [round(c, decimals) for c in coords]
+        return [_quantize(c, decimals) for c in coords]
+    return coords
+
+
+def quantize_geojson(geojson, decimals=COORDINATE_DECIMALS):
+    """
+    Arredonda as coordenadas de um GeoJSON (texto ou dict) para `decimals`
+    casas. Devolve um dict, pronto para `json_script`.
+    """
+    data = json.loads(geojson) if isinstance(geojson, str) else dict(geojson)
+    if "coordinates" in data:
+        data["coordinates"] = _quantize(data["coordinates"], decimals)
+    if "geometries" in data:
+        data["geometries"] = [quantize_geojson(g, decimals) for g in data["geometries"]]
+    return data
+
+
+def _parse(geojson):
+    return GEOSGeometry(geojson if isinstance(geojson, str) else json.dumps(geojson))
+
+
+def coarse_geometry(geojson, levels=LOD_LEVELS, decimals=COORDINATE_DECIMALS):
+    """
+    Versão de uma geometria enviada na carga inicial do mapa: a do nível
+    mais grosseiro, simplificada com `simplify(preserve_topology=True)` —
+    anéis não se cruzam nem somem.
+
+    Devolve `(gj, nivel, niveis)`: a geometria, o `max_zoom` do nível usado
+    e os `max_zoom` dos níveis mais detalhados, que o mapa busca sob demanda
+    (`geometry_for_level`) conforme o zoom. Quando a simplificação não
+    remove nenhum vértice, a geometria já é a completa: `nivel` é None e
+    não há o que buscar depois.
+
+    Só afeta o desenho no mapa: áreas e percentuais continuam vindo da
+    intersecção original, calculada antes desta etapa.
+    """
+    full = quantize_geojson(geojson, decimals)
+    ordered = sorted(levels, key=lambda lv: lv["max_zoom"])
+    if not ordered:
+        return full, None, []
+    try:
+        geom = _parse(geojson)
+    except Exception:
+        return full, None, []
+
+    simplified = geom.simplify(ordered[0]["tolerance"], preserve_topology=True)
+    if simplified.empty or simplified.num_points >= geom.num_points:
+        return full, None, []
+    return (
+        quantize_geojson(simplified.geojson, decimals),
+        ordered[0]["max_zoom"],
+        [lv["max_zoom"] for lv in ordered[1:]],
+    )
+
+
+def geometry_for_level(geojson, nivel, levels=LOD_LEVELS, decimals=COORDINATE_DECIMALS):
+    """
+    Geometria no nível de detalhe `nivel` (o `max_zoom` de um dos `levels`);
+    qualquer outro valor devolve a geometria completa quantizada.
+    """
+    full = quantize_geojson(geojson, decimals)
+    tolerance = next((lv["tolerance"] for lv in levels if lv["max_zoom"] == nivel), None)
+    if tolerance is None:
+        return full
+    try:
+        simplified = _parse(geojson).simplify(tolerance, preserve_topology=True)
+    except Exception:
+        return full
+    if simplified.empty:
+        return full
+    return quantize_geojson(simplified.geojson, decimals)
@@ -1,5 +1,11 @@
 from django.conf import settings
 
+from analysis.services.view_services.geometry_lod import (
+    coarse_geometry,
+    geometry_for_level,
+    quantize_geojson,
+)
+
 
 def planet_tiles_url():
     try:
@@ -12,35 +18,103 @@ def planet_tiles_url():
     return ''
 
 
-def format_data_map(data):
-    """Monta `data['map_items']` a partir de `data['resultado']`, no formato
-    esperado pelo template `analysis/results.html` / `maps.js`."""
+def _map_item(index, geojson, label, area, color, fonte, lod=False):
+    # Sem `lod` (ex.: sessões antigas, sem id no `ResultStore`) o item leva a
+    # geometria completa. Com `lod`, só a versão do nível mais grosseiro: o
+    # `maps.js` busca os níveis de `gj_niveis` (e a completa, acima deles)
+    # em `map_geometry_url` conforme o zoom.
+    item = {
+        "indice": index,
+        "label": label,
+        "area": area,
+        "color": color,
+        "fonte": fonte,
+    }
+    if not lod:
+        item["gj"] = quantize_geojson(geojson)
+        return item
+    gj, nivel, niveis = coarse_geometry(geojson)
+    item["gj"] = gj
+    if nivel is not None:
+        item["gj_nivel"] = nivel
+        item["gj_niveis"] = niveis
+    return item
+
+
+def map_geometries(data):
+    """Geometrias do mapa na ordem de `data['map_items']` (campo `indice`):
+    a área da propriedade e depois cada polígono de `poligonos_imoveis`."""
     resultado = data.get('resultado') or {}
     alvo_geojson = resultado.get('alvo_geojson')
-    tamanho_area = resultado.get('tamanho_area', 0)
-    poligonos_imoveis = resultado.get('poligonos_imoveis', [])
-
     if not alvo_geojson:
+        return []
+    return [alvo_geojson] + [
+        p["polygon_geojson"] for p in resultado.get('poligonos_imoveis', [])
+    ]
+
+
+def format_data_map(data, geometry_url=None):
+    """Monta `data['map_items']` a partir de `data['resultado']`, no formato
+    esperado pelo template `analysis/results.html` / `maps.js`.
+
+    Com `geometry_url` (a URL que responde `map_geometries_payload` para
+    este resultado), os itens saem só no nível de detalhe mais grosseiro e
+    o mapa busca os demais sob demanda."""
+    resultado = data.get('resultado') or {}
+    geometries = map_geometries(data)
+    if not geometries:
         return data
 
+    lod = geometry_url is not None
+    tamanho_area = resultado.get('tamanho_area', 0)
     items = [
-        {
-            "gj": alvo_geojson,
-            "label": "Área da Propriedade",
-            "area": f'{tamanho_area:.4f} ha',
-            "color": "#000000",
-            "fonte": "Área da Propriedade",
-        }
+        _map_item(
+            0,
+            geometries[0],
+            "Área da Propriedade",
+            f'{tamanho_area:.4f} ha',
+            "#000000",
+            "Área da Propriedade",
+            lod,
+        )
     ]
 
-    for p in poligonos_imoveis:
-        items.append({
-            "gj": p["polygon_geojson"],
-            "label": p["item_info"],
-            "area": f'{p["area"]:.4f} ha',
-            "color": p["color"],
-            "fonte": p["fonte"],
-        })
+    for index, p in enumerate(resultado.get('poligonos_imoveis', []), start=1):
+        items.append(_map_item(
+            index,
+            p["polygon_geojson"],
+            p["item_info"],
+            f'{p["area"]:.4f} ha',
+            p["color"],
+            p["fonte"],
+            lod,
+        ))
 
     data['map_items'] = items
+    data['map_geometry_url'] = geometry_url or ''
     return data
+
+
+def map_geometries_payload(data, params):
+    """
+    Resposta das URLs de geometria sob demanda do mapa: as geometrias dos
+    itens `params['itens']` (índices separados por vírgula) no nível
+    `params['nivel']` — o `max_zoom` de um nível de `LOD_LEVELS`; qualquer
+    outro valor traz a geometria completa. Índices inexistentes são
+    ignorados.
+    """
+    try:
+        nivel = int(params.get('nivel', ''))
+    except ValueError:
+        nivel = None
+
+    geometries = map_geometries(data)
+    payload = {}
+    for raw in (params.get('itens') or '').split(','):
+        try:
+            index = int(raw)
+        except ValueError:
+            continue
+        if 0 <= index < len(geometries) and index not in payload:
+            payload[index] = geometry_for_level(geometries[index], nivel)
+    return {"geometrias": payload}
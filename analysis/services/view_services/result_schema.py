@@ -0,0 +1,162 @@
+import json
+
+from django.contrib.gis.geos import GEOSGeometry
+
+from analysis.services.view_services.geometry_lod import quantize_geojson
+
+RESULT_SCHEMA_VERSION = 2
+
+# Casas decimais das geometrias persistidas (~1 cm em graus, SRID 4674).
+STORED_COORDINATE_DECIMALS = 7
+
+
+class _GeometryTable:
+    """Lista de geometrias únicas; cada GeoJSON é gravado uma única vez."""
+
+    def __init__(self):
+        self.items = []
+        self._index = {}
+
+    def ref(self, geojson):
+        if not geojson:
+            return None
+        try:
+            compact = quantize_geojson(geojson, STORED_COORDINATE_DECIMALS)
+        except (TypeError, ValueError):
+            return None
+        key = json.dumps(compact, separators=(",", ":"), sort_keys=True)
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.items)
+            self.items.append(compact)
+            self._index[key] = index
+        return index
+
+
+def _compact_row(row, geometries):
+    row = dict(row)
+    row.pop("polygon_wkt", None)
+    row["geom_ref"] = geometries.ref(row.pop("polygon_geojson", None))
+    return row
+
+
+def compact_resultado(resultado):
+    """
+    Converte o `resultado` do `FinalResultBuilder` (v1) para o formato
+    compacto v2:
+
+    - Cada geometria aparece uma única vez em `geometrias` (GeoJSON com
+      coordenadas arredondadas), referenciada por índice (`geom_ref`,
+      `alvo_ref`) nos registros, em `poligonos_imoveis` e no alvo.
+    - O WKT não é gravado (é derivável do GeoJSON) e a lista global
+      `areas_encontradas`, que repete os registros de cada base, é omitida.
+
+    Não altera o dict recebido. Resultados já em v2 voltam como estão.
+    """
+    if not resultado or resultado.get("versao") == RESULT_SCHEMA_VERSION:
+        return resultado
+
+    geometries = _GeometryTable()
+    compact = dict(resultado)
+    compact["versao"] = RESULT_SCHEMA_VERSION
+    compact.pop("areas_encontradas", None)
+    compact.pop("alvo_wkt", None)
+    compact["alvo_ref"] = geometries.ref(compact.pop("alvo_geojson", None))
+
+    bases = []
+    for base in resultado.get("resultados_por_base") or []:
+        base = dict(base)
+        base["areas_encontradas"] = [
+            _compact_row(row, geometries) for row in base.get("areas_encontradas") or []
+        ]
+        bases.append(base)
+    compact["resultados_por_base"] = bases
+
+    compact["poligonos_imoveis"] = [
+        _compact_row(p, geometries) for p in resultado.get("poligonos_imoveis") or []
+    ]
+    compact["geometrias"] = geometries.items
+    return compact
+
+
+def _expand_row(row, geometries):
+    row = dict(row)
+    ref = row.pop("geom_ref", None)
+    if ref is not None:
+        row["polygon_geojson"] = json.dumps(geometries[ref])
+    return row
+
+
+def expand_resultado(resultado):
+    """
+    Leitor único dos dois formatos: devolve o `resultado` no formato v1
+    esperado pelos templates e views. Resultados v1 (ex.: históricos antigos)
+    passam direto; os v2 recuperam `polygon_geojson`, `alvo_geojson`,
+    `alvo_wkt` e a lista global `areas_encontradas`.
+
+    O WKT dos registros não é reconstruído — nenhuma tela o usa depois que o
+    resultado é montado; só o `alvo_wkt` (exportação KML/SHP) é derivado.
+    """
+    if not resultado or resultado.get("versao") != RESULT_SCHEMA_VERSION:
+        return resultado
+
+    geometries = resultado.get("geometrias") or []
+    expanded = {
+        k: v for k, v in resultado.items()
+        if k not in ("versao", "geometrias", "alvo_ref")
+    }
+
+    bases = []
+    all_areas = []
+    for base in resultado.get("resultados_por_base") or []:
+        base = dict(base)
+        base["areas_encontradas"] = [
+            _expand_row(row, geometries) for row in base.get("areas_encontradas") or []
+        ]
+        all_areas.extend(base["areas_encontradas"])
+        bases.append(base)
+    expanded["resultados_por_base"] = bases
+    expanded["areas_encontradas"] = all_areas
+
+    expanded["poligonos_imoveis"] = [
+        _expand_row(p, geometries) for p in resultado.get("poligonos_imoveis") or []
+    ]
+
+    alvo_ref = resultado.get("alvo_ref")
+    expanded["alvo_geojson"] = None
+    expanded["alvo_wkt"] = None
+    if alvo_ref is not None:
+        alvo_geojson = json.dumps(geometries[alvo_ref])
+        expanded["alvo_geojson"] = alvo_geojson
+        try:
+            expanded["alvo_wkt"] = GEOSGeometry(alvo_geojson).wkt
+        except Exception:
+            pass
+    return expanded
+
+
+def compact_analysis(data):
+    """
+    Versão persistível do dict completo da análise (sessão/`ResultStore`/
+    `SearchHistory.result_data`): `resultado` em v2 e geometrias GEOS soltas
+    (ex.: `coordenadas_recebidas`) como WKT, para caber em JSON.
+    """
+    if not data:
+        return data
+    compact = {}
+    for key, value in data.items():
+        if key == "resultado" and isinstance(value, dict):
+            value = compact_resultado(value)
+        elif isinstance(value, GEOSGeometry):
+            value = value.wkt
+        compact[key] = value
+    return compact
+
+
+def expand_analysis(data):
+    """Inverso de `compact_analysis` para leitura (aceita v1 e v2)."""
+    if not data or not isinstance(data.get("resultado"), dict):
+        return dict(data or {})
+    expanded = dict(data)
+    expanded["resultado"] = expand_resultado(data["resultado"])
+    return expanded
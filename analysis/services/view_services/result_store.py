@@ -0,0 +1,62 @@
+import json
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class _ResultEncoder(DjangoJSONEncoder):
+    """Aceita geometrias GEOS (ex.: `coordenadas_recebidas`), gravadas como WKT."""
+
+    def default(self, o):
+        wkt = getattr(o, "wkt", None)
+        if wkt is not None:
+            return wkt
+        return super().default(o)
+
+
+class ResultStore:
+    """
+    Armazena o resultado completo de uma análise fora da sessão.
+
+    O dict do resultado (todas as geometrias de todas as camadas) é
+    serializado em JSON, comprimido com zlib e gravado no cache
+    `settings.ANALYSIS_RESULT_CACHE` (Redis) sob um id aleatório, com validade
+    `settings.ANALYSIS_RESULT_TTL`. A sessão guarda só esse id — a tabela
+    `django_session` deixa de receber um blob de megabytes a cada busca, e
+    só as views que precisam do resultado o leem.
+    """
+
+    key_prefix = "analysis_result"
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, "ANALYSIS_RESULT_CACHE", "default")]
+        self.timeout = getattr(settings, "ANALYSIS_RESULT_TTL", 60 * 60 * 24)
+
+    def _key(self, result_id):
+        return f"{self.key_prefix}:{result_id}"
+
+    @staticmethod
+    def dumps(data):
+        return zlib.compress(json.dumps(data, cls=_ResultEncoder).encode("utf-8"))
+
+    @staticmethod
+    def loads(blob):
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def save(self, data):
+        """Grava o resultado e devolve o id gerado."""
+        result_id = uuid.uuid4().hex
+        self.cache.set(self._key(result_id), self.dumps(data), self.timeout)
+        return result_id
+
+    def load(self, result_id):
+        """Devolve o resultado, ou None se o id não existe ou expirou."""
+        if not result_id:
+            return None
+        blob = self.cache.get(self._key(result_id))
+        if blob is None:
+            return None
+        return self.loads(blob)
@@ -0,0 +1,150 @@
+import threading
+
+import redis
+from django.conf import settings
+
+# Limites (s) dos histogramas.
+SEARCH_DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 180)
+LAYER_QUERY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+# (nome, tipo, descrição) na ordem de exposição em /metrics.
+METRICS = (
+    ("terraview_searches_total", "counter", "Buscas de sobreposição executadas."),
+    ("terraview_search_duration_seconds", "histogram", "Duração total das buscas de sobreposição."),
+    ("terraview_search_sql_queries_total", "counter", "Consultas SQL executadas pelas buscas."),
+    ("terraview_layer_query_duration_seconds", "histogram",
+     "Duração da consulta que trouxe a camada (no modo single_query, a do UNION ALL inteiro)."),
+    ("terraview_layer_formatter_seconds_total", "counter", "Tempo gasto nos Formatters da camada."),
+    ("terraview_layer_rows_returned_total", "counter", "Linhas devolvidas pelo banco para a camada."),
+    ("terraview_layer_rows_discarded_total", "counter", "Linhas da camada descartadas após a consulta."),
+    ("terraview_layer_geometry_bytes_total", "counter", "Bytes de geometria (EWKB) lidos da camada."),
+    ("terraview_layer_sql_queries_total", "counter", "Consultas SQL que trouxeram a camada."),
+    ("terraview_layer_cache_hits_total", "counter", "Vezes em que a camada veio do cache de sobreposição."),
+    ("terraview_layer_not_evaluated_total", "counter", "Vezes em que a camada ficou sem avaliação (tempo limite)."),
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _redis():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    getattr(settings, "METRICS_REDIS_URL", "redis://127.0.0.1:6379/1"),
+                    socket_timeout=1,
+                )
+    return _client
+
+
+def _series(name, **labels):
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return f"{name}{{{pairs}}}"
+
+
+def _format_le(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class SearchMetrics:
+    """
+    Contadores e histogramas das buscas de sobreposição no formato do
+    Prometheus, expostos em /metrics.
+
+    A busca roda em vários processos (uwsgi e workers Celery), então os
+    valores não ficam em memória: cada busca soma os seus em um hash do Redis
+    (`HINCRBYFLOAT`, um único round trip) e /metrics lê o hash inteiro. Os
+    buckets dos histogramas já são gravados acumulados, como o Prometheus
+    espera.
+    """
+
+    key = "metrics:overlap"
+
+    def __init__(self, client=None):
+        self.client = client or _redis()
+
+    def _observe(self, increments, name, value, buckets, **labels):
+        for bound in tuple(buckets) + (float("inf"),):
+            if value <= bound:
+                increments[_series(f"{name}_bucket", **labels, le=_format_le(bound))] = 1
+        increments[_series(f"{name}_sum", **labels)] = value
+        increments[_series(f"{name}_count", **labels)] = 1
+
+    def record(self, performance):
+        """Soma uma busca (`performance` de `SearchAll.execute`) às métricas."""
+        increments = {}
+        increments["terraview_searches_total"] = 1
+        increments["terraview_search_sql_queries_total"] = performance.get("sql_queries") or 0
+        self._observe(
+            increments, "terraview_search_duration_seconds",
+            performance.get("time_total") or 0, SEARCH_DURATION_BUCKETS,
+        )
+
+        for layer, values in (performance.get("layers") or {}).items():
+            status = values.get("status")
+            if status == "cached":
+                increments[_series("terraview_layer_cache_hits_total", layer=layer)] = 1
+            elif status == "not_evaluated":
+                increments[_series("terraview_layer_not_evaluated_total", layer=layer)] = 1
+            if values.get("query_layers"):
+                self._observe(
+                    increments, "terraview_layer_query_duration_seconds",
+                    values.get("query_time") or 0, LAYER_QUERY_BUCKETS, layer=layer,
+                )
+            for name, key in (
+                ("terraview_layer_formatter_seconds_total", "formatter_time"),
+                ("terraview_layer_rows_returned_total", "rows_returned"),
+                ("terraview_layer_rows_discarded_total", "rows_discarded"),
+                ("terraview_layer_geometry_bytes_total", "geometry_bytes"),
+                ("terraview_layer_sql_queries_total", "sql_queries"),
+            ):
+                increments[_series(name, layer=layer)] = values.get(key) or 0
+
+        pipe = self.client.pipeline(transaction=False)
+        for field, amount in increments.items():
+            pipe.hincrbyfloat(self.key, field, amount)
+        pipe.execute()
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        values = {
+            field.decode(): value.decode()
+            for field, value in self.client.hgetall(self.key).items()
+        }
+
+        lines = []
+        for name, kind, help_text in METRICS:
+            prefixes = (
+                (f"{name}_bucket", f"{name}_sum", f"{name}_count")
+                if kind == "histogram" else (name,)
+            )
+            series = [
+                field for field in values
+                if field.split("{", 1)[0] in prefixes
+            ]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for field in sorted(series, key=self._sort_key):
+                lines.append(f"{field} {values[field]}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _sort_key(field):
+        # Agrupa por série (nome + demais rótulos) e ordena os buckets por `le`.
+        name, _, labels = field.partition("{")
+        le = float("-inf")
+        others = []
+        for pair in labels.rstrip("}").split(","):
+            key, _, value = pair.partition("=")
+            if key == "le":
+                value = value.strip('"')
+                le = float("inf") if value == "+Inf" else float(value)
+            elif pair:
+                others.append(pair)
+        suffix_order = {"_bucket": 0, "_sum": 1, "_count": 2}
+        suffix = next((s for s in suffix_order if name.endswith(s)), "")
+        return (",".join(others), suffix_order.get(suffix, 0), le)
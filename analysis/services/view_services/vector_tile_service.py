@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+
+from kernel.utils import get_layer_versions
+
+# Resolução interna do tile e margem (em unidades do tile) recortada além da
+# borda, para que os contornos não apareçam cortados entre tiles vizinhos.
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+
+# SQLSTATE do Postgres para consulta cancelada (`statement_timeout`).
+_QUERY_CANCELED = "57014"
+
+
+class VectorTileTimeout(Exception):
+    """A geração do tile estourou `VECTOR_TILE_STATEMENT_TIMEOUT_MS`."""
+
+
+def _is_query_canceled(exc):
+    cause = exc.__cause__
+    return (getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)) == _QUERY_CANCELED
+
+
+class VectorTileService:
+    """
+    Gera tiles vetoriais (Mapbox Vector Tile) de uma camada a partir de
+    `usable_geometry`, com `ST_AsMVT`/`ST_AsMVTGeom` no PostGIS.
+
+    Cada tile lê só as feições que tocam o envelope (índice GiST da camada),
+    recorta-as na caixa do tile e simplifica na resolução do zoom antes de
+    reprojetar para Web Mercator — o tamanho do tile fica limitado pela área
+    visível, não pelo tamanho dos polígonos da camada.
+
+    Os tiles ficam no cache do Django (Redis) sob a versão de dados da camada
+    (`kernel.utils.get_layer_versions`): reimportar ou excluir a base troca a
+    versão e os tiles antigos deixam de ser lidos.
+
+    Um tile ainda fora do cache é gerado na requisição, com
+    `statement_timeout` de `VECTOR_TILE_STATEMENT_TIMEOUT_MS`: ao estourar,
+    levanta `VectorTileTimeout` e o tile não é tentado de novo por
+    `VECTOR_TILE_RETRY_AFTER` segundos. Camadas muito densas (ex.: SICAR)
+    definem um zoom mínimo próprio (`min_zoom`, de `LAYER_REGISTRY`).
+    """
+
+    def __init__(self, model, min_zoom=None):
+        self.model = model
+        self.min_zoom = max(getattr(settings, "VECTOR_TILE_MIN_ZOOM", 6), min_zoom or 0)
+        self.timeout = getattr(settings, "VECTOR_TILE_CACHE_TIMEOUT", 60 * 60 * 24 * 7)
+        self.statement_timeout_ms = getattr(settings, "VECTOR_TILE_STATEMENT_TIMEOUT_MS", 5000)
+        self.retry_after = getattr(settings, "VECTOR_TILE_RETRY_AFTER", 300)
+
+    @staticmethod
+    def is_valid_tile(z, x, y):
+        if z < 0 or z > MAX_ZOOM:
+            return False
+        limit = 2 ** z
+        return 0 <= x < limit and 0 <= y < limit
+
+    def _cache_key(self, z, x, y):
+        version = get_layer_versions([self.model])[self.model.__name__]
+        return f"tile:{self.model.__name__}:{version}:{z}/{x}/{y}"
+
+    def build_sql(self, z, x, y):
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        geom_col = f"t.{qn(self.model._meta.get_field('usable_geometry').column)}"
+
+        # Largura do tile em graus: usada para a margem de recorte e para a
+        # tolerância de simplificação (~1 unidade do grid do tile).
+        tile_degrees = 360.0 / (2 ** z)
+        margin = tile_degrees * TILE_BUFFER / TILE_EXTENT
+        tolerance = tile_degrees / TILE_EXTENT
+
+        sql = (
+            "WITH limites AS ("
+            "SELECT ST_TileEnvelope(%s, %s, %s) AS env_3857, "
+            "ST_Transform(ST_TileEnvelope(%s, %s, %s), 4674) AS env), "
+            "feicoes AS ("
+            f"SELECT t.{qn('id')} AS id, "
+            f"ST_AsMVTGeom(ST_Transform(ST_Simplify("
+            f"ST_ClipByBox2D({geom_col}, ST_Expand(limites.env, %s)), %s, true), 3857), "
+            f"limites.env_3857, {TILE_EXTENT}, {TILE_BUFFER}, true) AS geom "
+            f"FROM {table} t CROSS JOIN limites "
+            f"WHERE {geom_col} && limites.env) "
+            f"SELECT ST_AsMVT(feicoes.*, %s, {TILE_EXTENT}, 'geom') "
+            "FROM feicoes WHERE geom IS NOT NULL"
+        )
+        params = [z, x, y, z, x, y, margin, tolerance, self.model.__name__]
+        return sql, params
+
+    def _fetch(self, sql, params):
+        # `set_config(..., true)` equivale a `SET LOCAL`: vale só para esta
+        # transação, como em `MultiLayerOverlapQuery._fetch`.
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    if self.statement_timeout_ms:
+                        cursor.execute(
+                            "SELECT set_config('statement_timeout', %s, true)",
+                            [str(int(self.statement_timeout_ms))],
+                        )
+                    cursor.execute(sql, params)
+                    return cursor.fetchone()
+        except OperationalError as exc:
+            if _is_query_canceled(exc):
+                raise VectorTileTimeout() from exc
+            raise
+
+    def get_tile(self, z, x, y):
+        """Bytes do tile (vazio abaixo do zoom mínimo ou sem feições).
+        Levanta `VectorTileTimeout` se a geração estourou o tempo limite."""
+        if z < self.min_zoom:
+            return b""
+
+        key = self._cache_key(z, x, y)
+        tile = cache.get(key)
+        if tile is None:
+            timeout_key = f"{key}:tempo_esgotado"
+            if cache.get(timeout_key):
+                raise VectorTileTimeout()
+            sql, params = self.build_sql(z, x, y)
+            try:
+                row = self._fetch(sql, params)
+            except VectorTileTimeout:
+                cache.set(timeout_key, True, self.retry_after)
+                raise
+            tile = bytes(row[0]) if row and row[0] is not None else b""
+            cache.set(key, tile, self.timeout)
+        return tile
@@ -0,0 +1,86 @@
+(function () {
+    // Acompanha uma busca executada em background (run_analysis_job).
+    // Cada poll do status traz as bases concluídas desde o anterior
+    // (`desde` = quantas já chegaram; as críticas primeiro), listadas
+    // enquanto as demais são analisadas; ao fim do job, segue para os
+    // resultados.
+    const jobEl = document.getElementById('analysis-job');
+    const progressEl = document.getElementById('analysis-job-progress');
+    const basesEl = document.getElementById('analysis-job-bases');
+    if (!jobEl) return;
+
+    const statusUrl = jobEl.dataset.statusUrl;
+    const POLL_INTERVAL = 1500;
+    let finished = false;
+    let cursor = 0;
+
+    function renderProgress(done, total) {
+        if (!progressEl || !total) return;
+        progressEl.textContent = done + ' de ' + total + ' bases analisadas';
+    }
+
+    function formatArea(value) {
+        return Number(value || 0).toLocaleString('pt-BR', {
+            minimumFractionDigits: 2,
+            maximumFractionDigits: 2,
+        }) + ' ha';
+    }
+
+    function renderBase(base) {
+        if (!basesEl || !base.nome_base) return;
+
+        const item = document.createElement('li');
+        item.className = 'job-base job-base--' + (base.severidade || 'info');
+
+        const name = document.createElement('span');
+        name.textContent = base.nome_base;
+
+        const total = document.createElement('span');
+        total.className = 'job-base__total';
+        const count = base.total_areas_com_sobreposicao || 0;
+        if (base.nao_avaliado) {
+            total.textContent = 'Não avaliada (tempo esgotado)';
+        } else {
+            total.textContent = count
+                ? count + (count === 1 ? ' área · ' : ' áreas · ') + formatArea(base.total_area)
+                : 'Sem sobreposição';
+        }
+
+        item.appendChild(name);
+        item.appendChild(total);
+
+        // Bases críticas com sobreposição ficam no topo da lista.
+        if (base.severidade === 'critical' && count) {
+            basesEl.insertBefore(item, basesEl.firstChild);
+        } else {
+            basesEl.appendChild(item);
+        }
+    }
+
+    function poll() {
+        const url = statusUrl + (statusUrl.indexOf('?') === -1 ? '?' : '&') + 'desde=' + cursor;
+        fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+            .then(function (resp) {
+                if (!resp.ok) throw new Error('HTTP ' + resp.status);
+                return resp.json();
+            })
+            .then(function (job) {
+                (job.camadas || []).forEach(renderBase);
+                cursor = job.cursor || cursor;
+                renderProgress(job.camadas_concluidas, job.camadas_total);
+                if (job.redirect_url) {
+                    finished = true;
+                    if (job.erro) alert('Erro ao analisar: ' + job.erro);
+                    window.location.href = job.redirect_url;
+                    return;
+                }
+                setTimeout(poll, POLL_INTERVAL);
+            })
+            .catch(function () {
+                // Falha de rede momentânea: tenta de novo com intervalo maior.
+                if (!finished) setTimeout(poll, POLL_INTERVAL * 2);
+            });
+    }
+
+    poll();
+})();
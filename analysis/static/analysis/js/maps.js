@@ -77,16 +77,53 @@
         return 'hsl(' + h + ',' + s + '%,' + l + '%)';
     }
 
+    /**
+     * Nível de detalhe (LOD) de um item para um zoom: o `max_zoom` do nível
+     * mais grosseiro que ainda cobre o zoom, ou 'completo' acima do último.
+     * Só o nível inicial (`item.gj_nivel`) vem na página; os demais são
+     * buscados em `options.geometry_url` (ver setupLod). Itens sem
+     * `gj_nivel` (ex.: relatório impresso) usam sempre `item.gj`.
+     */
+    function pickLodLevel(item, zoom) {
+        if (zoom <= item.gj_nivel) return String(item.gj_nivel);
+        var levels = item.gj_niveis || [];
+        for (var i = 0; i < levels.length; i++) {
+            if (zoom <= levels[i]) return String(levels[i]);
+        }
+        return 'completo';
+    }
+
+    function parseGeometry(gj) {
+        return typeof gj === 'string' ? JSON.parse(gj) : gj;
+    }
+
+    /**
+     * Tooltip e destaque ao passar o mouse em cada feição da camada.
+     */
+    function bindFeatureEvents(layer, tooltipText, isOutline, opacity, weight) {
+        layer.eachLayer(function (fl) {
+            if (tooltipText) { fl.bindTooltip(tooltipText, { sticky: true }); }
+            fl.on('mouseover', function (e) {
+                e.target.setStyle({ weight: 3, fillOpacity: isOutline ? 0.1 : 0.5 });
+            });
+            fl.on('mouseout', function (e) {
+                e.target.setStyle({ weight: weight, fillOpacity: opacity });
+            });
+        });
+    }
+
     /**
      * Processes a single item and adds it to the appropriate layer group.
+     * Returns the LOD entry ({ layer, item, bind, level, cache }) or null.
      */
     function createGeoJsonLayer(item, layersByFonte, overlays, map, allGroup, legend) {
         try {
-            var gj = item.gj;
-            if (!gj) return;
-            
-            var geom = typeof gj === 'string' ? JSON.parse(gj) : gj;
-            if (!geom) return;
+            if (!item.gj) return null;
+
+            // Começa pelo nível enviado na página (o mais simplificado); o
+            // zoom real só é conhecido depois do fitBounds (ver setupLod).
+            var geom = parseGeometry(item.gj);
+            if (!geom) return null;
 
             var f = item.fonte || 'Fonte';
             var isPropriedade = (f === PROPERTY_FONTE);
@@ -124,18 +161,10 @@
                 .filter(function (x) { return x && ('' + x).trim() !== ''; })
                 .join('<br> Área: ');
 
-            // Bind tooltip and hover effects
-            (function (l, tooltipText, isOutline, opacity, weight) {
-                l.eachLayer(function (fl) {
-                    if (tooltipText) { fl.bindTooltip(tooltipText, { sticky: true }); }
-                    fl.on('mouseover', function (e) {
-                        e.target.setStyle({ weight: 3, fillOpacity: isOutline ? 0.1 : 0.5 });
-                    });
-                    fl.on('mouseout', function (e) {
-                        e.target.setStyle({ weight: weight, fillOpacity: opacity });
-                    });
-                });
-            })(layer, tt, (isSicar || isPropriedade), baseFillOpacity, baseWeight);
+            var bind = function (l) {
+                bindFeatureEvents(l, tt, (isSicar || isPropriedade), baseFillOpacity, baseWeight);
+            };
+            bind(layer);
 
             layer.addTo(layersByFonte[f]);
             allGroup.addLayer(layer);
@@ -144,8 +173,13 @@
                 legend[f] = col;
             }
 
+            var cache = {};
+            cache[String(item.gj_nivel)] = geom;
+            return { layer: layer, item: item, bind: bind, level: String(item.gj_nivel), cache: cache, loading: {} };
+
         } catch (e) {
             console.error("Error processing item", e);
+            return null;
         }
     }
 
@@ -157,19 +191,92 @@
         var layersByFonte = {};
         var allGroup = L.featureGroup().addTo(map);
         var legend = {};
+        var lodEntries = [];
 
         for (var i = 0; i < items.length; i++) {
-            createGeoJsonLayer(items[i], layersByFonte, overlays, map, allGroup, legend);
+            var entry = createGeoJsonLayer(items[i], layersByFonte, overlays, map, allGroup, legend);
+            if (entry && entry.item.gj_nivel !== undefined) {
+                lodEntries.push(entry);
+            }
         }
 
         return {
             overlays: overlays,
             layersByFonte: layersByFonte,
             allGroup: allGroup,
-            legend: legend
+            legend: legend,
+            lodEntries: lodEntries
         };
     }
 
+    /**
+     * Troca a geometria de cada camada pelo nível de detalhe do zoom atual
+     * (só quando o nível muda), mantendo estilo, tooltip e destaque. Níveis
+     * ainda não carregados são buscados em `url` com uma requisição por
+     * nível, só para os itens que aparecem na área visível do mapa.
+     */
+    function setupLod(map, lodEntries, url) {
+        if (!lodEntries.length || !url) return;
+
+        function show(entry, level) {
+            if (entry.level === level) return;
+            entry.level = level;
+            entry.layer.clearLayers();
+            entry.layer.addData(entry.cache[level]);
+            entry.bind(entry.layer);
+        }
+
+        function load(level, entries) {
+            var indices = entries.map(function (entry) {
+                entry.loading[level] = true;
+                return entry.item.indice;
+            });
+            var query = '?nivel=' + encodeURIComponent(level) + '&itens=' + indices.join(',');
+            fetch(url + query, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+                .then(function (response) {
+                    if (!response.ok) throw new Error('HTTP ' + response.status);
+                    return response.json();
+                })
+                .then(function (body) {
+                    var geometrias = body.geometrias || {};
+                    entries.forEach(function (entry) {
+                        var gj = geometrias[entry.item.indice];
+                        if (gj) entry.cache[level] = parseGeometry(gj);
+                        if (entry.cache[level] && entry.wanted === level) show(entry, level);
+                    });
+                })
+                .catch(function () {
+                    // Mantém o nível já exibido; uma próxima mudança de zoom
+                    // tenta de novo.
+                })
+                .then(function () {
+                    entries.forEach(function (entry) { delete entry.loading[level]; });
+                });
+        }
+
+        function update() {
+            var zoom = map.getZoom();
+            var view = map.getBounds();
+            var missing = {};
+            for (var i = 0; i < lodEntries.length; i++) {
+                var entry = lodEntries[i];
+                var level = pickLodLevel(entry.item, zoom);
+                entry.wanted = level;
+                if (entry.cache[level]) {
+                    show(entry, level);
+                    continue;
+                }
+                if (entry.loading[level] || !entry.bounds.intersects(view)) continue;
+                (missing[level] = missing[level] || []).push(entry);
+            }
+            Object.keys(missing).forEach(function (level) { load(level, missing[level]); });
+        }
+
+        lodEntries.forEach(function (entry) { entry.bounds = entry.layer.getBounds(); });
+        map.on('moveend', update);
+        update();
+    }
+
     /**
      * Builds the interactive legend.
      */
@@ -293,6 +400,7 @@
         if (data.allGroup.getLayers().length) {
             map.fitBounds(data.allGroup.getBounds(), { padding: [12, 12] });
         }
+        setupLod(map, data.lodEntries, options.geometry_url);
 
         // 5. Controls & Legend
         if (!isStatic) {
@@ -0,0 +1,201 @@
+import base64
+import io
+import uuid
+
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = get_task_logger(__name__)
+
+
+def _performance_fields(performance):
+    """Colunas de instrumentação do `SearchHistory` a partir do `performance`
+    de `SearchAll` (vazio em buscas sem resultado, ex.: CAR não encontrado)."""
+    if not performance:
+        return {}
+    layers = performance.get('layers') or {}
+
+    def own_time(values):
+        return (values.get('query_time') or 0) + (values.get('formatter_time') or 0)
+
+    slowest = max(layers, key=lambda name: own_time(layers[name]), default='')
+    total = performance.get('time_total')
+    return {
+        'duration_ms': int(total * 1000) if total is not None else None,
+        'sql_queries': performance.get('sql_queries'),
+        'slowest_layer': slowest,
+        'slowest_layer_ms': int(own_time(layers[slowest]) * 1000) if slowest else None,
+        'layers_not_evaluated': sum(
+            1 for values in layers.values() if values.get('status') == 'not_evaluated'
+        ),
+        'layer_metrics': layers,
+    }
+
+
+def build_history_fields(data, search_type, user_id):
+    """Campos de listagem do `SearchHistory` extraídos do dict da análise."""
+    resultado = data.get('resultado') or {}
+    return {
+        **_performance_fields(resultado.get('performance') or {}),
+        'user_id': user_id,
+        'search_type': search_type,
+        'car_input': data.get('car_input') or '',
+        'municipio': data.get('municipio') or '',
+        'uf': data.get('uf') or '',
+        'area_ha': resultado.get('tamanho_area'),
+        'conflitos_count': resultado.get('total_areas_com_sobreposicao') or 0,
+        'sucesso': bool(data.get('sucesso')),
+        'erro': data.get('erro') or '',
+    }
+
+
+def write_search_history(entry_id, fields, data=None, created_at=None, profile=None):
+    """Grava um registro de `SearchHistory` (idempotente por `entry_id`).
+
+    `data` é o dict compactado da análise, gravado como `SearchResultPayload`
+    (deduplicado pelo conteúdo). Uma entrada já gravada por uma entrega
+    anterior da mesma mensagem é ignorada. `profile` é o pacote de
+    `SearchProfiler.bundle()` das buscas em modo de perfil."""
+    from analysis.models import SearchHistory, SearchProfile, SearchResultPayload
+
+    # Histórico, perfil e horário entram juntos: se qualquer parte falha,
+    # nada fica gravado e a nova tentativa da mensagem refaz tudo.
+    with transaction.atomic():
+        if SearchHistory.objects.filter(entry_id=entry_id).exists():
+            return False
+
+        payload = SearchResultPayload.objects.store(data) if data else None
+        try:
+            with transaction.atomic():
+                history = SearchHistory.objects.create(entry_id=entry_id, payload=payload, **fields)
+        except IntegrityError:
+            # Outra entrega da mesma mensagem gravou a entrada primeiro.
+            return False
+
+        if profile is not None:
+            blob = SearchProfile.encode(profile)
+            SearchProfile.objects.create(history=history, data=blob, size_bytes=len(blob))
+
+        # `created_at` é `auto_now_add`: mantém o horário da busca, não o da
+        # gravação pelo worker.
+        created = parse_datetime(created_at) if created_at else None
+        if created is not None:
+            SearchHistory.objects.filter(pk=history.pk).update(created_at=created)
+    return True
+
+
+@shared_task(bind=True, acks_late=True, max_retries=5, default_retry_delay=30)
+def save_search_history_task(self, entry_id, fields, data=None, created_at=None, profile=None):
+    """Grava o histórico de uma busca em background.
+
+    A mensagem leva o dict compactado da análise (`data`): o payload é
+    gravado aqui, fora do tempo de resposta, sem depender do TTL do
+    `ResultStore`. A mensagem só é confirmada depois da gravação
+    (`acks_late`) e falhas de banco são repetidas: cada busca é gravada ao
+    menos uma vez, e o `entry_id` gerado por quem enfileira evita
+    duplicatas quando a mensagem é entregue de novo."""
+    try:
+        write_search_history(entry_id, fields, data=data, created_at=created_at, profile=profile)
+    except Exception as exc:
+        logger.exception("Falha ao gravar histórico da busca %s.", entry_id)
+        raise self.retry(exc=exc)
+    return {"ok": True, "entry_id": entry_id}
+
+
+@shared_task(
+    bind=True,
+    soft_time_limit=getattr(settings, "ANALYSIS_JOB_TIME_LIMIT", 15 * 60),
+    time_limit=getattr(settings, "ANALYSIS_JOB_HARD_TIME_LIMIT", 16 * 60),
+)
+def run_analysis_job(self, job_id, kind, params, user_id=None):
+    """Executa uma busca submetida pela view (`AnalysisJobStore`) no worker.
+
+    `kind` é o tipo de busca (`SearchHistory.SearchType`); `params` traz o
+    necessário para refazê-la aqui: `car_input`, a geometria em EWKT
+    (`geometria`) ou o PDF em base64 (`arquivo`, com `result_key`);
+    `profile` liga o modo de perfil (só staff, ver `SearchProfiler`). O
+    progresso por camada é publicado no estado do job; ao final, o resultado
+    vai para o `ResultStore`, o job é marcado como concluído e o histórico é
+    enfileirado (`save_search_history_task`)."""
+    from django.contrib.gis.geos import GEOSGeometry
+
+    from analysis.models import SearchHistory
+    from analysis.services.analyze_coordinates.overlap.formatter_register import FormatterRegister
+    from analysis.services.analyze_coordinates.search_profiler import SearchProfiler
+    from analysis.services.view_services.analysis_job_store import (
+        JOB_TIMEOUT_MESSAGE,
+        STATUS_DONE,
+        STATUS_ERROR,
+        AnalysisJobStore,
+        JobProgress,
+    )
+    from analysis.services.view_services.analysis_runner import DOC_SEARCH_TYPE, AnalysisRunner
+    from analysis.services.view_services.result_schema import compact_analysis
+    from analysis.services.view_services.result_store import ResultStore
+    from doc_extractor.services.parsers.constants import TypeDocument
+
+    store = AnalysisJobStore()
+    progress = JobProgress(store, job_id)
+    progress.start(len(FormatterRegister().formatters))
+    profiler = SearchProfiler() if params.get('profile') else None
+    runner = AnalysisRunner(on_layer_done=progress, profiler=profiler)
+    car_input = params.get('car_input') or ''
+
+    try:
+        if kind == SearchHistory.SearchType.CAR:
+            data = runner.by_car(car_input)
+        elif kind in DOC_SEARCH_TYPE.values():
+            result_key = params['result_key']
+            doc_type = TypeDocument.STATEMENT if result_key == 'demonstrativo' else TypeDocument.RECEIPT
+            file_obj = io.BytesIO(base64.b64decode(params['arquivo']))
+            data = runner.by_document(file_obj, doc_type, result_key, car_input)
+        else:
+            geometry = GEOSGeometry(params['geometria'])
+            try:
+                data = runner.by_geometry(geometry, car_input)
+            except SoftTimeLimitExceeded:
+                raise
+            except Exception as exc:
+                # Mesmo comportamento da view: a falha vira um resultado com
+                # `erro`, exibido na página de resultados e gravado no histórico.
+                logger.exception("Falha na análise do job %s.", job_id)
+                data = AnalysisRunner.geometry_error(geometry, car_input, exc)
+    except SoftTimeLimitExceeded:
+        logger.warning("Job %s excedeu o tempo limite.", job_id)
+        store.update(job_id, status=STATUS_ERROR, erro=JOB_TIMEOUT_MESSAGE)
+        return {"ok": False, "error": JOB_TIMEOUT_MESSAGE}
+    except Exception as exc:
+        logger.exception("Falha na análise do job %s.", job_id)
+        store.update(job_id, status=STATUS_ERROR, erro=str(exc))
+        return {"ok": False, "error": str(exc)}
+
+    profile = None
+    if profiler is not None:
+        profile = profiler.bundle((data.get('resultado') or {}).get('performance'))
+
+    data = compact_analysis(data)
+    result_id = ResultStore().save(data)
+    store.update(job_id, status=STATUS_DONE, result_id=result_id)
+
+    # O histórico segue o mesmo caminho das buscas síncronas (tarefa própria,
+    # com `acks_late` e retentativas); o usuário não espera por ele.
+    entry_id = str(uuid.uuid4())
+    fields = build_history_fields(data, kind, user_id)
+    created_at = timezone.now().isoformat()
+    try:
+        save_search_history_task.delay(
+            entry_id, fields, data=data, created_at=created_at, profile=profile
+        )
+    except Exception:
+        logger.exception("Falha ao enfileirar o histórico do job %s.", job_id)
+        try:
+            write_search_history(entry_id, fields, data=data, created_at=created_at, profile=profile)
+        except Exception:
+            logger.exception("Falha ao gravar histórico do job %s.", job_id)
+
+    return {"ok": True, "result_id": result_id}
@@ -87,16 +87,21 @@ def pct_of_property(area, total_area):
 
 @register.filter
 def bases_overview(bases):
-    """Resume a lista de bases consultadas: quantas têm sobreposição e quantas são críticas/de atenção."""
+    """Resume a lista de bases consultadas: quantas têm sobreposição, quantas são críticas/de atenção e quantas ficaram sem avaliação."""
     bases = bases or []
+    nao_avaliadas = [b for b in bases if b.get("quantidade_nao_avaliados")]
     com_sobreposicao = [b for b in bases if b.get("areas_encontradas")]
-    sem_sobreposicao = [b for b in bases if not b.get("areas_encontradas")]
+    sem_sobreposicao = [
+        b for b in bases
+        if not b.get("areas_encontradas") and not b.get("quantidade_nao_avaliados")
+    ]
     criticas = sum(1 for b in com_sobreposicao if base_severity(b.get("nome_base")) == "critical")
     atencao = sum(1 for b in com_sobreposicao if base_severity(b.get("nome_base")) == "warning")
     return {
         "total": len(bases),
         "com_sobreposicao": len(com_sobreposicao),
         "sem_sobreposicao": len(sem_sobreposicao),
+        "nao_avaliadas": len(nao_avaliadas),
         "criticas": criticas,
         "atencao": atencao,
     }
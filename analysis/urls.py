@@ -6,10 +6,16 @@ urlpatterns = [
     path('analysis/', login_required(views.UploadZipCarView.as_view()), name='upload_zip_car'),
     path('', views.Lading_PageView.as_view(), name='landing_page'),
     path('report/print/', login_required(views.ReportPrintView.as_view()), name='report_print'),
+    path('analysis/job/<str:job_id>/', login_required(views.AnalysisJobView.as_view()), name='analysis_job'),
+    path('analysis/job/<str:job_id>/status/', login_required(views.AnalysisJobStatusView.as_view()), name='analysis_job_status'),
     path('results/', login_required(views.ResultsPageView.as_view()), name='results'),
+    path('results/<str:result_id>/geometrias/', login_required(views.ResultsGeometriesView.as_view()), name='results_geometrias'),
     path('historico/', login_required(views.HistoricoView.as_view()), name='historico'),
     path('historico/<int:pk>/', login_required(views.HistoricoDetalheView.as_view()), name='historico_detalhe'),
+    path('historico/<int:pk>/geometrias/', login_required(views.HistoricoGeometriesView.as_view()), name='historico_geometrias'),
     path('download/property-kml/', login_required(views.DownloadPropertyKmlView.as_view()), name='download_property_kml'),
     path('download/property-shp/', login_required(views.DownloadPropertyShapefileView.as_view()), name='download_property_shp'),
+    path('tiles/<str:modelo>/<int:z>/<int:x>/<int:y>.pbf', login_required(views.VectorTileView.as_view()), name='vector_tile'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('termos/', views.termos, name='termos_de_uso')
 ]
@@ -1,17 +1,21 @@
 # Standard library
+import base64
+import hmac
 import io
 import os
 import tempfile
+import uuid
 import zipfile
-from dataclasses import asdict
 
 # Django
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils import timezone
 from django.views import View
 
 import geopandas as gpd
@@ -19,49 +23,169 @@ from shapely import wkt as shapely_wkt
 
 # Local apps – analysis
 from analysis.models import SearchHistory
-from analysis.services.analyze_coordinates.search_all import SearchAll
-from analysis.services.analyze_coordinates.search_for_car import SearchForCar
+from analysis.services.analyze_coordinates.search_profiler import SearchProfiler
+from analysis.services.view_services.analysis_job_store import (
+    STATUS_DONE,
+    STATUS_ERROR,
+    AnalysisJobStore,
+)
+from analysis.services.view_services.analysis_runner import DOC_SEARCH_TYPE, AnalysisRunner
 from analysis.services.view_services.result_map_formatter import (
     format_data_map,
+    map_geometries_payload,
     planet_tiles_url,
 )
+from analysis.services.view_services.result_schema import compact_analysis, expand_analysis
+from analysis.services.view_services.result_store import ResultStore
+from analysis.services.view_services.search_metrics import SearchMetrics
+from analysis.services.view_services.vector_tile_service import VectorTileService, VectorTileTimeout
 from analysis.services.view_services.zip_upload_service import ZipUploadService
+from analysis.tasks import (
+    build_history_fields,
+    run_analysis_job,
+    save_search_history_task,
+    write_search_history,
+)
 from analysis.validators import validate_car_number
 
-# Local apps – car_system / kernel
+# Local apps – car_system / control_panel / kernel
 from car_system.utils import get_sicar_record
-from kernel.utils import extract_geometry, locate_city_state
+from control_panel.layer_registry import LAYER_REGISTRY
+from kernel.utils import extract_geometry
 
 # Local apps – doc_extractor
 from doc_extractor.services.parsers.constants import TypeDocument
-from doc_extractor.services.parsers.context.extract_data_context import DocumentDataContext
-from doc_extractor.services.parsers.factory.documents_parser_factory import DocumentsParserFactory
-from doc_extractor.services.parsers.implement.extract_text.extract_pdf_plumber import (
-    ExtractDocumentPdfPlumber,
-)
 
-def _save_search_history(request, data, search_type):
+def _profile_requested(request):
+    """Modo de perfil (`?profile=1`): só para staff. O formulário de upload
+    não tem `action`, então o parâmetro da URL segue junto no POST."""
+    flag = request.GET.get('profile') or request.POST.get('profile')
+    return request.user.is_staff and flag == '1'
+
+
+def _analysis_runner(request):
+    """`AnalysisRunner` da execução síncrona, com `SearchProfiler` quando o
+    modo de perfil foi pedido."""
+    profiler = SearchProfiler() if _profile_requested(request) else None
+    return AnalysisRunner(profiler=profiler)
+
+
+def _save_search_history(request, data, search_type, profiler=None):
     """Persiste um registro em `SearchHistory` para cada busca executada,
     para que o painel administrativo possa listar o que os usuários
-    pesquisaram. Não deve nunca quebrar o fluxo de busca do usuário."""
+    pesquisaram. Não deve nunca quebrar o fluxo de busca do usuário.
+
+    A gravação é feita pelo worker Celery (`save_search_history_task`), fora
+    do tempo de resposta: a mensagem leva os campos da listagem e o dict
+    compactado da análise, e o worker grava o payload. Se o broker estiver
+    fora do ar, grava aqui mesmo, de forma síncrona. Buscas em modo de
+    perfil (`profiler`) levam também o perfil."""
     try:
-        resultado = data.get('resultado') or {}
-        SearchHistory.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            search_type=search_type,
-            car_input=data.get('car_input') or '',
-            municipio=data.get('municipio') or '',
-            uf=data.get('uf') or '',
-            area_ha=resultado.get('tamanho_area'),
-            conflitos_count=resultado.get('total_areas_com_sobreposicao') or 0,
-            sucesso=bool(data.get('sucesso')),
-            erro=data.get('erro') or '',
-            result_data=data,
-        )
+        user_id = request.user.pk if request.user.is_authenticated else None
+        fields = build_history_fields(data, search_type, user_id)
+        entry_id = str(uuid.uuid4())
+        profile = None
+        if profiler is not None:
+            profile = profiler.bundle((data.get('resultado') or {}).get('performance'))
+        try:
+            save_search_history_task.delay(
+                entry_id, fields, data=data, created_at=timezone.now().isoformat(), profile=profile
+            )
+        except Exception:
+            write_search_history(entry_id, fields, data=data, profile=profile)
     except Exception:
         pass
 
 
+def _remember_analysis(request, data):
+    """Grava o resultado da busca no `ResultStore` e deixa na sessão só o
+    id dele — o dict completo (com todas as geometrias) não passa mais pela
+    tabela de sessões. Devolve o id gerado."""
+    result_id = ResultStore().save(compact_analysis(data))
+    request.session['last_analysis_id'] = result_id
+    request.session.pop('last_analysis', None)
+    return result_id
+
+
+def _load_last_analysis(request):
+    """Carrega o resultado da última busca da sessão ({} se não houver ou
+    se já expirou). Sessões anteriores ao `ResultStore` ainda trazem o dict
+    completo em `last_analysis`."""
+    legacy = request.session.get('last_analysis')
+    if legacy is not None:
+        return legacy
+    return expand_analysis(ResultStore().load(request.session.get('last_analysis_id')))
+
+
+def _last_analysis_geometry_url(request):
+    """URL das geometrias sob demanda do resultado da sessão (None para
+    sessões antigas, que guardam o dict completo)."""
+    result_id = request.session.get('last_analysis_id')
+    if request.session.get('last_analysis') is not None or not result_id:
+        return None
+    return reverse('results_geometrias', args=[result_id])
+
+
+def _map_geometries_response(request, data):
+    """Geometrias do mapa em outro nível de detalhe (`map_geometries_payload`).
+    O resultado referenciado não muda, então o navegador pode guardar a
+    resposta."""
+    response = JsonResponse(map_geometries_payload(data, request.GET))
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def _submit_analysis_job(request, kind, params):
+    """Enfileira a busca como job Celery (`run_analysis_job`) e devolve o
+    redirect para a página que acompanha o progresso — o processo uwsgi
+    fica livre enquanto o worker analisa as camadas.
+
+    Devolve None quando os jobs estão desligados
+    (`settings.ANALYSIS_JOBS_ENABLED`) ou o broker não aceitou a mensagem;
+    a view então executa a busca de forma síncrona, como antes."""
+    if not getattr(settings, 'ANALYSIS_JOBS_ENABLED', True):
+        return None
+    user_id = request.user.pk if request.user.is_authenticated else None
+    if _profile_requested(request):
+        params = {**params, 'profile': True}
+    job_id = AnalysisJobStore().create(user_id, kind)
+    try:
+        run_analysis_job.delay(job_id, kind, params, user_id)
+    except Exception:
+        return None
+    return redirect('analysis_job', job_id=job_id)
+
+
+def _analyze_geometry(request, coordenadas_input, car_input, search_type):
+    """Executa a pesquisa nas bases para uma geometria, persiste o resultado
+    e redireciona para a página de resultados (ou de acompanhamento)."""
+    geometria = getattr(coordenadas_input, 'ewkt', None) or str(coordenadas_input)
+    response = _submit_analysis_job(
+        request, search_type, {'geometria': geometria, 'car_input': car_input}
+    )
+    if response is not None:
+        return response
+
+    runner = _analysis_runner(request)
+    try:
+        data = runner.by_geometry(coordenadas_input, car_input)
+    except Exception as e:
+        data = AnalysisRunner.geometry_error(coordenadas_input, car_input, e)
+
+    data = compact_analysis(data)
+    _remember_analysis(request, data)
+    _save_search_history(request, data, search_type, profiler=runner.profiler)
+    return redirect('results')
+
+
+def _get_user_job(request, job_id):
+    job = AnalysisJobStore().get(job_id)
+    user_id = request.user.pk if request.user.is_authenticated else None
+    if job is None or job.get('user_id') != user_id:
+        raise Http404('Análise não encontrada.')
+    return job
+
+
 class HomePageView(View):
     template_name = 'analysis/home.html'
 
@@ -72,9 +196,9 @@ class ResultsPageView(View):
     template_name = 'analysis/results.html'
 
     def get(self, request):
-        data = request.session.get('last_analysis') or {}
+        data = _load_last_analysis(request)
         data['planet_tiles_url'] = planet_tiles_url()
-        data = format_data_map(data)
+        data = format_data_map(data, _last_analysis_geometry_url(request))
         return render(request, self.template_name, data)
 
     def post(self, request):
@@ -89,38 +213,10 @@ class ResultsPageView(View):
     # =====================================================================
 
     def _process_coordinates(self, request, coordenadas_input, car_input):
-        """Executa a pesquisa nas bases, persiste na sessão e redireciona para GET."""
-        try:
-            resultado = SearchAll().execute(coordenadas_input)
-
-            municipio, uf = None, None
-            try:
-                municipio, uf = locate_city_state(coordenadas_input)
-            except Exception:
-                pass
-
-            data = {
-                'resultado': resultado,
-                'coordenadas_recebidas': coordenadas_input,
-                'car_input': car_input,
-                'municipio': municipio,
-                'uf': uf,
-                'sucesso': True
-            }
-            _save_search_history(request, data, SearchHistory.SearchType.COORDENADAS)
-            request.session['last_analysis'] = data
-            return redirect('results')
-
-        except Exception as e:
-            data = {
-                'erro': f'Erro ao processar coordenadas: {str(e)}',
-                'coordenadas_recebidas': coordenadas_input,
-                'car_input': car_input,
-                'sucesso': False
-            }
-            _save_search_history(request, data, SearchHistory.SearchType.COORDENADAS)
-            request.session['last_analysis'] = data
-            return redirect('results')
+        """Executa a pesquisa nas bases, persiste o resultado e redireciona para GET."""
+        return _analyze_geometry(
+            request, coordenadas_input, car_input, SearchHistory.SearchType.COORDENADAS
+        )
 
     def _render_error(self, request, message, car_input=None):
         return render(request, self.template_name, {
@@ -130,12 +226,26 @@ class ResultsPageView(View):
             'planet_tiles_url': planet_tiles_url()
         })
 
+class ResultsGeometriesView(View):
+    """Geometrias do mapa de resultados da sessão em outro nível de
+    detalhe, buscadas pelo `maps.js` conforme o zoom."""
+
+    def get(self, request, result_id):
+        if result_id != request.session.get('last_analysis_id'):
+            raise Http404('Resultado não encontrado.')
+        data = expand_analysis(ResultStore().load(result_id))
+        if not data:
+            raise Http404('Resultado não encontrado.')
+        return _map_geometries_response(request, data)
+
+
 class HistoricoView(View):
     """Lista as buscas que o próprio usuário logado já realizou."""
     template_name = 'analysis/historico.html'
 
     def get(self, request):
-        historico_qs = SearchHistory.objects.filter(user=request.user)
+        # A listagem nunca carrega o resultado das buscas.
+        historico_qs = SearchHistory.objects.filter(user=request.user).defer('result_data')
 
         filtro_tipo = request.GET.get('tipo', '').strip()
         if filtro_tipo:
@@ -164,11 +274,13 @@ class HistoricoDetalheView(View):
     """Reabre o resultado de uma busca do próprio usuário logado."""
 
     def get(self, request, pk):
-        historico = get_object_or_404(SearchHistory, pk=pk, user=request.user)
+        historico = get_object_or_404(
+            SearchHistory.objects.select_related('payload'), pk=pk, user=request.user
+        )
 
-        data = dict(historico.result_data or {})
+        data = expand_analysis(historico.get_result_data())
         data['planet_tiles_url'] = planet_tiles_url()
-        data = format_data_map(data)
+        data = format_data_map(data, reverse('historico_geometrias', args=[pk]))
         data['is_historico'] = True
         data['historico'] = historico
         data['historico_back_url'] = reverse('historico')
@@ -178,11 +290,22 @@ class HistoricoDetalheView(View):
         return render(request, 'analysis/results.html', data)
 
 
+class HistoricoGeometriesView(View):
+    """Geometrias do mapa de uma busca do próprio usuário em outro nível de
+    detalhe (ver `ResultsGeometriesView`)."""
+
+    def get(self, request, pk):
+        historico = get_object_or_404(
+            SearchHistory.objects.select_related('payload'), pk=pk, user=request.user
+        )
+        return _map_geometries_response(request, expand_analysis(historico.get_result_data()))
+
+
 class ReportPrintView(View):
     template_name = 'analysis/report_print.html'
 
     def get(self, request):
-        data = request.session.get('last_analysis') or {}
+        data = _load_last_analysis(request)
         data = self.format_data(data)
         return render(request, self.template_name, data)
 
@@ -234,7 +357,7 @@ class ReportPrintView(View):
 
 class DownloadPropertyShapefileView(View):
     def get(self, request):
-        data = request.session.get('last_analysis') or {}
+        data = _load_last_analysis(request)
         resultado = data.get('resultado') or {}
         alvo_wkt = resultado.get('alvo_wkt')
 
@@ -288,7 +411,7 @@ class DownloadPropertyShapefileView(View):
 
 class DownloadPropertyKmlView(View):
     def get(self, request):
-        data = request.session.get('last_analysis') or {}
+        data = _load_last_analysis(request)
         resultado = data.get('resultado') or {}
         alvo_wkt = resultado.get('alvo_wkt')
 
@@ -332,6 +455,47 @@ class DownloadPropertyKmlView(View):
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
+class VectorTileView(View):
+    """Tile vetorial (MVT) de uma camada de `LAYER_REGISTRY`, para exibir
+    as bases completas como contexto no mapa em qualquer zoom. Responde 503
+    quando o tile não pôde ser gerado no tempo limite."""
+
+    def get(self, request, modelo, z, x, y):
+        entry = LAYER_REGISTRY.get(modelo)
+        if entry is None or not VectorTileService.is_valid_tile(z, x, y):
+            raise Http404('Tile não encontrado.')
+
+        service = VectorTileService(entry['model'], min_zoom=entry.get('tile_min_zoom'))
+        try:
+            tile = service.get_tile(z, x, y)
+        except VectorTileTimeout:
+            response = HttpResponse(status=503)
+            response['Retry-After'] = str(service.retry_after)
+            return response
+        response = HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+        response['Cache-Control'] = 'private, max-age=300'
+        return response
+
+
+class MetricsView(View):
+    """Métricas das buscas no formato do Prometheus (`SearchMetrics`).
+
+    Exige sempre `Authorization: Bearer <settings.METRICS_TOKEN>`: sem token
+    configurado a rota responde 404 — a porta da aplicação é publicada no
+    host, então o bloqueio do nginx sozinho não basta."""
+
+    def get(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise Http404()
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        received = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(received.encode(), f'Bearer {token}'.encode()):
+            raise Http404()
+        return HttpResponse(
+            SearchMetrics().render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
 class UploadZipCarView(View):
     template_upload = 'analysis/upload.html'
     template_index = 'analysis/results.html'
@@ -422,57 +586,34 @@ class UploadZipCarView(View):
     # Métodos auxiliares
     # =====================================================================
 
-    def _get_car_data(self, car_number):
-        """Busca dados do CAR e localidade."""
-        resultado = {}
-        municipio, state = None, None
-        
-        if car_number:
-            try:
-                resultado = SearchForCar().execute(car_number) or {}
-                qs = get_sicar_record(car_number__iexact=car_number)
-                if qs.exists():
-                    geometry = qs.first().geometry
-                    municipio, state = locate_city_state(geometry)
-            except Exception:
-                pass
-        return resultado, municipio, state
-
-    _DOC_SEARCH_TYPE = {
-        'demonstrativo': SearchHistory.SearchType.DEMONSTRATIVO,
-        'recibo': SearchHistory.SearchType.RECIBO,
-    }
-
     def _handle_document_upload(self, request, file_obj, doc_type, result_key, car_input, missing_msg, error_prefix, context):
         """Processa upload de documentos (Recibo ou Demonstrativo)."""
         if not file_obj:
             context['erro'] = missing_msg
             return render(request, self.template_upload, context)
 
+        search_type = DOC_SEARCH_TYPE.get(result_key, SearchHistory.SearchType.DEMONSTRATIVO)
         try:
-            parser = DocumentsParserFactory.create_parser(doc_type)
-            extractor = ExtractDocumentPdfPlumber()
-            ctx = DocumentDataContext(extractor, parser)
-            info = ctx.extract_data(file_obj)
-            
-            car_extraido = (info.car or car_input or '').strip()
-
-            resultado, municipio, state = self._get_car_data(car_extraido)
-
-            #esultado, municipio, state = {}, "Palmas", "TO"
-            data = {
-                'resultado': resultado,
-                result_key: asdict(info),
-                'car_input': car_extraido,
-                'municipio': municipio,
-                'uf': state,
-                'sucesso': True
-            }
+            content = file_obj.read()
+            file_obj.seek(0)
+        except Exception as e:
+            context['erro'] = f'{error_prefix}: {str(e)}'
+            return render(request, self.template_upload, context)
 
-            _save_search_history(
-                request, data, self._DOC_SEARCH_TYPE.get(result_key, SearchHistory.SearchType.DEMONSTRATIVO)
-            )
-            request.session['last_analysis'] = data
+        response = _submit_analysis_job(request, search_type, {
+            'arquivo': base64.b64encode(content).decode('ascii'),
+            'result_key': result_key,
+            'car_input': car_input,
+        })
+        if response is not None:
+            return response
+
+        runner = _analysis_runner(request)
+        try:
+            data = runner.by_document(file_obj, doc_type, result_key, car_input)
+            data = compact_analysis(data)
+            _remember_analysis(request, data)
+            _save_search_history(request, data, search_type, profiler=runner.profiler)
             return redirect('results')
 
         except Exception as e:
@@ -481,18 +622,20 @@ class UploadZipCarView(View):
 
     def _handle_only_car(self, request, car_input, context):
         """Processa requisição apenas com o CAR (sem ZIP)."""
+        response = _submit_analysis_job(
+            request, SearchHistory.SearchType.CAR, {'car_input': car_input}
+        )
+        if response is not None:
+            return response
+
+        runner = _analysis_runner(request)
         try:
-            resultado, municipality, state = self._get_car_data(car_input)
-
-            data = {
-                'resultado': resultado,
-                'car_input': car_input,
-                'municipio': municipality,
-                'uf': state,
-                'sucesso': True
-            }
-            _save_search_history(request, data, SearchHistory.SearchType.CAR)
-            request.session['last_analysis'] = data
+            data = runner.by_car(car_input)
+            data = compact_analysis(data)
+            _remember_analysis(request, data)
+            _save_search_history(
+                request, data, SearchHistory.SearchType.CAR, profiler=runner.profiler
+            )
             return redirect('results')
 
         except Exception as e:
@@ -501,34 +644,60 @@ class UploadZipCarView(View):
 
     def _process_coordinates(self, request, coordenadas_input, car_input):
         """Processa os dados extraídos do shapefile."""
+        return _analyze_geometry(
+            request, coordenadas_input, car_input, SearchHistory.SearchType.SHAPEFILE
+        )
+
+
+class AnalysisJobView(View):
+    """Página de espera de uma busca em background: acompanha o progresso
+    por polling em `AnalysisJobStatusView` e segue para os resultados."""
+    template_name = 'analysis/analysis_job.html'
+
+    def get(self, request, job_id):
+        job = _get_user_job(request, job_id)
+        return render(request, self.template_name, {
+            'job': job,
+            'status_url': reverse('analysis_job_status', args=[job_id]),
+        })
+
+
+class AnalysisJobStatusView(View):
+    """Estado do job em JSON, com as bases concluídas desde o cursor do
+    cliente (`?desde=N`, quantas já recebeu): cada poll traz só as novas, na
+    ordem em que terminaram — as críticas primeiro. A resposta é imediata;
+    nenhum processo uwsgi fica preso esperando o job.
+
+    Quando a busca termina, o resultado passa a ser a última análise da
+    sessão e a resposta indica para onde seguir."""
+
+    def get(self, request, job_id):
+        job = _get_user_job(request, job_id)
+        done = job.get('camadas_concluidas') or []
         try:
-            resultado = SearchAll().execute(coordenadas_input)
-            municipio, uf = None, None
-            try:
-                municipio, uf = locate_city_state(coordenadas_input)
-            except Exception:
-                pass
-            data = {
-                'resultado': resultado,
-                'coordenadas_recebidas': coordenadas_input,
-                'car_input': car_input,
-                'municipio': municipio,
-                'uf': uf,
-                'sucesso': True
-            }
-            _save_search_history(request, data, SearchHistory.SearchType.SHAPEFILE)
-            request.session['last_analysis'] = data
-            return redirect('results')
-        except Exception as e:
-            data = {
-                'erro': f'Erro ao processar coordenadas: {str(e)}',
-                'coordenadas_recebidas': coordenadas_input,
-                'car_input': car_input,
-                'sucesso': False
-            }
-            _save_search_history(request, data, SearchHistory.SearchType.SHAPEFILE)
-            request.session['last_analysis'] = data
-            return redirect('results')
+            since = min(max(0, int(request.GET.get('desde') or 0)), len(done))
+        except ValueError:
+            since = 0
+
+        store = AnalysisJobStore()
+        payload = {
+            'status': job.get('status'),
+            'camadas_total': job.get('camadas_total') or 0,
+            'camadas_concluidas': len(done),
+            'camadas': [
+                store.get_layer_result(job_id, layer_name) or {'camada': layer_name}
+                for layer_name in done[since:]
+            ],
+            'cursor': len(done),
+            'erro': job.get('erro'),
+        }
+        if job.get('status') == STATUS_DONE and job.get('result_id'):
+            request.session['last_analysis_id'] = job['result_id']
+            request.session.pop('last_analysis', None)
+            payload['redirect_url'] = reverse('results')
+        elif job.get('status') == STATUS_ERROR:
+            payload['redirect_url'] = reverse('upload_zip_car')
+        return JsonResponse(payload)
 
 def termos(request):
     return render(request, 'analysis/termos_de_uso.html')
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_system', '0010_alter_declaredhydrography_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='declaredhydrography',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='sicarrecord',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+    ]
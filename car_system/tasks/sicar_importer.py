@@ -1,6 +1,6 @@
 from datetime import datetime
 
-import geopandas as gpd
+import pandas as pd
 
 from car_system.models import SicarRecord
 from kernel.service.bulk_shapefile_importer import BulkShapefileImporter
@@ -10,13 +10,11 @@ class SicarImporter(BulkShapefileImporter):
     model = SicarRecord
     archive_field = "sicar_zip_file"
     source = "Base Sicar"
+    read_kwargs = {"encoding": "utf-8"}
 
     def missing_archive_message(self):
         return "Nenhum arquivo de SICAR foi configurado."
 
-    def read_dataframe(self, path):
-        return gpd.read_file(path, encoding="utf-8")
-
     @staticmethod
     def format_date(date_str):
         try:
@@ -31,5 +29,16 @@ class SicarImporter(BulkShapefileImporter):
             "last_update": self.format_date(row.get("dat_atuali")),
         }
 
+    def format_columns(self, df):
+        # Os campos de `format_fields`, calculados por coluna: a base SICAR
+        # tem centenas de milhares de linhas.
+        dates = df["dat_atuali"] if "dat_atuali" in df else pd.Series(None, index=df.index, dtype=object)
+        last_update = pd.to_datetime(dates, format="%d/%m/%Y", errors="coerce")
+        return pd.DataFrame({
+            "car_number": df.get("cod_imovel"),
+            "status": df.get("ind_status"),
+            "last_update": last_update.dt.date.astype(object).where(last_update.notna(), None),
+        }, index=df.index)
+
     def natural_key(self, row):
         return row.get("cod_imovel")
@@ -3,6 +3,9 @@ Registro operacional das camadas de SHP: liga cada 'modelo' (mesma chave usada
 em `bases_config.BASES_CONFIG`) à classe do Model e à classe Importer usada
 para (re)processar o arquivo enviado.
 
+`tile_min_zoom` (opcional) é o zoom mínimo dos tiles vetoriais da camada
+(`VectorTileService`), para bases densas demais para os zooms afastados.
+
 Usado pelas views de upload/processar/excluir do painel "Bases de Dados",
 para não repetir em cada view qual Importer/Model pertence a qual camada.
 """
@@ -48,13 +51,13 @@ LAYER_REGISTRY = {
     "PhytoecologyArea": {"model": PhytoecologyArea, "importer": PhytoecologyAreaImporter},
     "EnvironmentalProtectionArea": {"model": EnvironmentalProtectionArea, "importer": EnvironmentalProtectionAreaImporter},
     "IndigenousArea": {"model": IndigenousArea, "importer": IndigenousAreaImporter},
-    "SicarRecord": {"model": SicarRecord, "importer": SicarImporter},
+    "SicarRecord": {"model": SicarRecord, "importer": SicarImporter, "tile_min_zoom": 11},
     "DeclaredHydrography": {"model": DeclaredHydrography, "importer": HydrographyImporter},
     "Quilombolas": {"model": Quilombolas, "importer": QuilombolasImporter},
     "Paths": {"model": Paths, "importer": PathsImporter},
     "ConservationUnits": {"model": ConservationUnits, "importer": ConservationUnitsImporter},
     "MunicipalBoundaries": {"model": MunicipalBoundaries, "importer": MunicipalBoundariesImporter},
-    "Sigef": {"model": Sigef, "importer": SigefImporter},
+    "Sigef": {"model": Sigef, "importer": SigefImporter, "tile_min_zoom": 11},
     "Ruralsettlement": {"model": Ruralsettlement, "importer": RuralsettlementImporter},
     "SnicTotal": {"model": SnicTotal, "importer": SnicTotalImporter},
     "DeforestationMapbiomas": {"model": DeforestationMapbiomas, "importer": DeforestationMapbiomasImporter},
@@ -31,6 +31,8 @@ urlpatterns = [
     path('usuarios/', _staff_only(views.usuarios_view), name='usuarios'),
     path('buscas/', _staff_only(views.buscas_view), name='buscas'),
     path('buscas/<int:pk>/', _staff_only(views.busca_detalhe_view), name='busca_detalhe'),
+    path('buscas/<int:pk>/geometrias/', _staff_only(views.busca_geometrias_view), name='busca_geometrias'),
+    path('buscas/<int:pk>/perfil/', _staff_only(views.busca_perfil_view), name='busca_perfil'),
     path('bases-de-dados/', _staff_only(views.bases_dados_view), name='bases_dados'),
     path('bases-de-dados/<str:modelo>/upload/', _staff_only(views.base_upload_view), name='base_upload'),
     path('bases-de-dados/<str:modelo>/processar/', _staff_only(views.base_processar_view), name='base_processar'),
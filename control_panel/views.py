@@ -1,17 +1,19 @@
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import Http404
+from django.db.models import Exists, OuterRef, Q
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.decorators.http import require_POST
 
-from analysis.models import SearchHistory
+from analysis.models import SearchHistory, SearchProfile
 from analysis.services.view_services.result_map_formatter import (
     format_data_map,
+    map_geometries_payload,
     planet_tiles_url,
 )
+from analysis.services.view_services.result_schema import expand_analysis
 from kernel.utils import cached_model_count, reset_db
 
 from . import utils
@@ -133,7 +135,10 @@ def usuarios_view(request):
 
 
 def buscas_view(request):
-    buscas_qs = SearchHistory.objects.select_related('user')
+    # A listagem nunca carrega o resultado das buscas.
+    buscas_qs = SearchHistory.objects.select_related('user').defer('result_data', 'layer_metrics').annotate(
+        has_profile=Exists(SearchProfile.objects.filter(history=OuterRef('pk')))
+    )
 
     filtro_tipo = request.GET.get('tipo', '').strip()
     if filtro_tipo:
@@ -169,11 +174,11 @@ def buscas_view(request):
 
 
 def busca_detalhe_view(request, pk):
-    historico = get_object_or_404(SearchHistory.objects.select_related('user'), pk=pk)
+    historico = get_object_or_404(SearchHistory.objects.select_related('user', 'payload'), pk=pk)
 
-    data = dict(historico.result_data or {})
+    data = expand_analysis(historico.get_result_data())
     data['planet_tiles_url'] = planet_tiles_url()
-    data = format_data_map(data)
+    data = format_data_map(data, reverse('control_panel:busca_geometrias', args=[pk]))
     data['is_historico'] = True
     data['historico'] = historico
     data['historico_back_url'] = reverse('control_panel:buscas')
@@ -183,6 +188,41 @@ def busca_detalhe_view(request, pk):
     return render(request, 'analysis/results.html', data)
 
 
+def busca_geometrias_view(request, pk):
+    """Geometrias do mapa de uma busca em outro nível de detalhe, buscadas
+    pelo `maps.js` conforme o zoom."""
+    historico = get_object_or_404(SearchHistory.objects.select_related('payload'), pk=pk)
+    response = JsonResponse(
+        map_geometries_payload(expand_analysis(historico.get_result_data()), request.GET)
+    )
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def busca_perfil_view(request, pk):
+    """Perfil de uma busca feita em modo de perfil (`?profile=1`): tempos
+    por camada, consultas SQL com EXPLAIN e o relatório do cProfile."""
+    perfil = get_object_or_404(SearchProfile.objects.select_related('history__user'), history_id=pk)
+    bundle = perfil.load()
+    performance = bundle.get('performance') or {}
+
+    camadas = sorted(
+        ({'nome': nome, **valores} for nome, valores in (performance.get('layers') or {}).items()),
+        key=lambda c: (c.get('query_time') or 0) + (c.get('formatter_time') or 0),
+        reverse=True,
+    )
+    context = {
+        'active_nav': 'buscas',
+        'historico': perfil.history,
+        'perfil': perfil,
+        'performance': performance,
+        'camadas': camadas,
+        'queries': bundle.get('queries') or [],
+        'cprofile': bundle.get('cprofile') or '',
+    }
+    return render(request, 'control_panel/busca_perfil.html', context)
+
+
 def _get_base_cfg(modelo):
     base_cfg = next((b for b in BASES_CONFIG if b['modelo'] == modelo), None)
     if base_cfg is None or modelo not in LAYER_REGISTRY:
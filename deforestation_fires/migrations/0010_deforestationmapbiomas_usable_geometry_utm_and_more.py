@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deforestation_fires', '0009_prodes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deforestationmapbiomas',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='embargoes',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='prodes',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+    ]
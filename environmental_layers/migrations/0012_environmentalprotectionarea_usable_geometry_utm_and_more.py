@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('environmental_layers', '0011_remove_environmentalprotectionarea_geometry_new_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='environmentalprotectionarea',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='indigenousarea',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='phytoecologyarea',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='zoningarea',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+    ]
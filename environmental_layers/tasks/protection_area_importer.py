@@ -1,5 +1,3 @@
-import geopandas as gpd
-
 from environmental_layers.models import EnvironmentalProtectionArea
 from kernel.service.bulk_shapefile_importer import BulkShapefileImporter
 
@@ -8,13 +6,12 @@ class EnvironmentalProtectionAreaImporter(BulkShapefileImporter):
     model = EnvironmentalProtectionArea
     archive_field = "environmental_protection_zip_file"
     source = "Base APA"
+    read_kwargs = {"encoding": "utf-8"}
+    subdivide_max_vertices = 256
 
     def missing_archive_message(self):
         return "Nenhum arquivo de APA foi configurado."
 
-    def read_dataframe(self, path):
-        return gpd.read_file(path, encoding="utf-8")
-
     def format_fields(self, row):
         return {
             "unit_name": row.get("Unidades"),
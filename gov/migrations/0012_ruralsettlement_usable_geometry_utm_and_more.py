@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gov', '0011_alter_sigef_property_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ruralsettlement',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='sigef',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='snictotal',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+    ]
@@ -1,5 +1,3 @@
-import geopandas as gpd
-
 from gov.models import Ruralsettlement
 from kernel.service.bulk_shapefile_importer import BulkShapefileImporter
 
@@ -8,13 +6,11 @@ class RuralsettlementImporter(BulkShapefileImporter):
     model = Ruralsettlement
     archive_field = "ruralsettlement_zip_file"
     source = "Base Assentamento Rural"
+    read_kwargs = {"encoding": "utf-8"}
 
     def missing_archive_message(self):
         return "Nenhum arquivo de assentamento rural foi configurado."
 
-    def read_dataframe(self, path):
-        return gpd.read_file(path, encoding="utf-8")
-
     def format_fields(self, row):
         return {
             "project_name": row.get("nome_proje"),
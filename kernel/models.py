@@ -17,6 +17,19 @@ class GeoBaseModel(models.Model):
         spatial_index=True,
         db_column="geometria_util",
     )
+
+    # Cópia de `usable_geometry` projetada em UTM 22S (EPSG:31982), gravada
+    # junto com ela pelos importadores/`GeometryProcessingService`. A análise
+    # de sobreposição intersecta e mede áreas aqui, sem reprojetar a camada a
+    # cada busca. Sem índice espacial: o filtro continua no índice de
+    # `usable_geometry`.
+    usable_geometry_utm = gis_models.GeometryField(
+        srid=31982,
+        null=True,
+        blank=True,
+        spatial_index=False,
+        db_column="geometria_util_utm",
+    )
     
     area_m2 = models.FloatField(
         verbose_name="Área (m²)",
@@ -1,36 +1,107 @@
+from collections import deque
+
 import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+from billiard.pool import Pool
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection, transaction
 
 from control_panel.utils import get_file_management
-from kernel.utils import reset_db
+from kernel.service.copy_loader import CopyLoader
+from kernel.service.staging_table_service import StagingTableService
+from kernel.service.subdivided_geometry_service import SubdividedGeometryService
+from kernel.utils import invalidate_layer_caches, reset_db
 
 SRID = 4674
 UTM_SRID = 31982
 
 
+def prepare_geometries(geoms):
+    """Prepara um bloco de geometrias de uma vez (Shapely 2): WKT original,
+    geometria corrigida com `make_valid` em EWKB (SRID 4674), a mesma em UTM
+    (uma única reprojeção do bloco) e a área em m². `geoms` é um array de
+    geometrias shapely; devolve um dict de arrays alinhados com ele.
+
+    Função de módulo para rodar nos processos de `prepare_workers`. Como
+    antes, as coordenadas do arquivo são tratadas como SIRGAS 2000
+    (EPSG:4674), independentemente do `.prj`."""
+    wkt = shapely.to_wkt(geoms, rounding_precision=-1)
+
+    invalid = ~shapely.is_valid(geoms) & ~shapely.is_missing(geoms)
+    if invalid.any():
+        geoms = geoms.copy()
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+
+    geoms_utm = np.asarray(
+        gpd.GeoSeries(geoms, crs=SRID).to_crs(UTM_SRID).array, dtype=object
+    )
+    return {
+        "wkt": wkt,
+        "ewkb": shapely.to_wkb(shapely.set_srid(geoms, SRID), include_srid=True),
+        "ewkb_utm": shapely.to_wkb(shapely.set_srid(geoms_utm, UTM_SRID), include_srid=True),
+        "area_m2": shapely.area(geoms_utm),
+    }
+
+
+def _geometry_array(df):
+    return np.asarray(df.geometry.array, dtype=object)
+
+
 class BulkShapefileImporter:
     """
     Importador genérico para as bases fixas de SHP (SICAR, Zoneamento, APAs,
     Fitoecologia, etc.).
 
-    Lê o arquivo inteiro com geopandas, monta todas as instâncias do Model em
-    memória (já com `usable_geometry`/`area_m2`/`area_ha` calculados) e grava
-    tudo em lotes com `bulk_create`, em vez de um INSERT + SELECT de dedup por
-    linha — para uma base com dezenas/centenas de milhares de registros isso é
-    a diferença entre segundos e horas.
+    O arquivo é lido em blocos de `chunk_size` feições (`read_chunks`, com
+    os lotes Arrow do pyogrio), e cada bloco é preparado e gravado antes da
+    leitura do próximo — a memória do worker não cresce com o tamanho da
+    base. `read_kwargs` vai para o pyogrio (ex.: `encoding`).
+
+    As geometrias de cada bloco são preparadas de uma vez
+    (`prepare_geometries`: `make_valid`, reprojeção para UTM e área em
+    operações vetorizadas do Shapely 2), e os registros do bloco são
+    gravados com `COPY ... FROM STDIN (FORMAT BINARY)` (`CopyLoader`,
+    geometrias em EWKB), em vez de um INSERT + SELECT de dedup por linha —
+    para uma base com dezenas/centenas de milhares de registros isso é a
+    diferença entre segundos e horas. Fora do PostgreSQL, ou com
+    `use_copy = False`, a carga volta para `bulk_create` em lotes de
+    `batch_size`.
+
+    A preparação das geometrias (`prepare_geometries`) é a parte cara em
+    CPU: com `prepare_workers` > 1 (padrão: `IMPORT_PREPARE_WORKERS`), os
+    blocos são distribuídos em um pool de processos, que devolve EWKB e
+    áreas; o processo do importador continua sendo o único que grava no
+    banco, na ordem do arquivo. O pool é do billiard (o mesmo do Celery),
+    que permite criar processos de dentro do worker prefork.
 
-    `reset_db` só é chamado depois que o arquivo foi lido e as instâncias
-    montadas com sucesso, para não truncar a tabela existente quando o
-    arquivo enviado está ausente/corrompido. Reprocessar sempre recarrega a
-    base do zero — por isso não há checagem de duplicados contra o banco.
+    A carga vai para uma tabela de carga (`StagingTableService`), que só
+    ganha índices e estatísticas depois de cheia e então substitui a camada
+    em uma transação curta: as buscas continuam lendo a versão anterior
+    durante toda a importação, e uma falha no meio do arquivo descarta a
+    tabela de carga sem tocar na camada. Sem COPY (`use_copy = False`), a
+    camada é truncada com `reset_db` — só depois que o primeiro bloco foi
+    lido e preparado — e recarregada em uma única transação. Reprocessar
+    sempre recarrega a base do zero — por isso não há checagem de
+    duplicados contra o banco.
+
+    Camadas com polígonos enormes definem `subdivide_max_vertices` para que,
+    após a carga, seja gerada a tabela-sombra com `ST_Subdivide`
+    (`SubdividedGeometryService`) usada pela análise de sobreposição.
     """
 
     model = None
     archive_field = None
     source = None
     batch_size = 2000
+    chunk_size = 20000
+    prepare_workers = None
+    read_kwargs = {}
+    use_copy = True
+    subdivide_max_vertices = None
 
     def __init__(self, user=None):
         self.user = user
@@ -50,40 +121,74 @@ class BulkShapefileImporter:
         """Retorna um dict dos campos específicos do Model (exceto geometry/created_by/source)."""
         raise NotImplementedError
 
+    def format_columns(self, df):
+        """Versão por coluna de `format_fields`, opcional: devolve um
+        DataFrame (uma coluna por campo do Model, mesmo índice de `df`).
+        None (padrão) faz a importação chamar `format_fields` linha a linha."""
+        return None
+
     def natural_key(self, row):
         """Chave opcional usada para descartar duplicados dentro do próprio
-        arquivo antes do bulk_create (necessário só quando o Model tem uma
+        arquivo antes da carga (necessário só quando o Model tem uma
         constraint unique nos campos importados, ex.: SicarRecord.car_number)."""
         return None
 
     def read_dataframe(self, path):
-        return gpd.read_file(path)
+        """Arquivo inteiro de uma vez. Importadores que sobrescrevem este
+        método (leitura própria) são importados em um único bloco."""
+        return gpd.read_file(path, **self.read_kwargs)
+
+    def read_chunks(self, path):
+        """GeoDataFrames de até `chunk_size` feições, em ordem, a partir dos
+        lotes Arrow do pyogrio. Sem o pyarrow (dependência do projeto), cai
+        para leituras por deslocamento (`skip_features`), mais lentas."""
+        if type(self).read_dataframe is not BulkShapefileImporter.read_dataframe:
+            yield self.read_dataframe(path)
+            return
 
-    def _apply_geometry(self, instance, wkt_value):
         try:
-            geom = GEOSGeometry(wkt_value, srid=SRID)
-            if not geom.valid:
-                geom = geom.buffer(0)
-            geom.srid = SRID
-
-            geom_utm = geom.transform(UTM_SRID, clone=True)
-            instance.usable_geometry = geom
-            instance.area_m2 = geom_utm.area
-            instance.area_ha = geom_utm.area / 10000
-        except Exception:
-            pass
-
-    def _build_instance(self, row, user):
-        wkt_value = str(row.get("geometry"))
-        fields = self.format_fields(row)
-        instance = self.model(
+            import pyarrow  # noqa: F401
+        except ImportError:
+            yield from self._read_chunks_by_offset(path)
+            return
+
+        with pyogrio.open_arrow(
+            path, batch_size=self.chunk_size, use_pyarrow=True, **self.read_kwargs
+        ) as (meta, reader):
+            geometry_name = meta.get("geometry_name") or "wkb_geometry"
+            for batch in reader:
+                if not batch.num_rows:
+                    continue
+                wkb = batch.column(geometry_name).to_numpy(zero_copy_only=False)
+                attributes = batch.drop_columns([geometry_name]).to_pandas()
+                yield gpd.GeoDataFrame(attributes, geometry=shapely.from_wkb(wkb))
+
+    def _read_chunks_by_offset(self, path):
+        offset = 0
+        while True:
+            df = pyogrio.read_dataframe(
+                path, skip_features=offset, max_features=self.chunk_size, **self.read_kwargs
+            )
+            if df.empty:
+                return
+            yield df
+            offset += len(df)
+            if len(df) < self.chunk_size:
+                return
+
+    def _build_instance(self, fields, user, wkt_value):
+        return self.model(
             **fields,
-            geometry=wkt_value,
+            geometry=wkt_value if wkt_value is not None else "",
             created_by=user,
             source=self.source,
         )
-        self._apply_geometry(instance, wkt_value)
-        return instance
+
+    @staticmethod
+    def _apply_area(instance, area_m2):
+        if not np.isnan(area_m2):
+            instance.area_m2 = float(area_m2)
+            instance.area_ha = float(area_m2) / 10000
 
     def _get_archive_path(self):
         file_mgmt = get_file_management()
@@ -92,34 +197,145 @@ class BulkShapefileImporter:
             raise ValueError(self.missing_archive_message())
         return file_field.path
 
-    def execute(self):
-        user = self._get_user()
-        path = self._get_archive_path()
-        df = self.read_dataframe(path)
+    def _prepare_workers(self):
+        workers = self.prepare_workers
+        if workers is None:
+            workers = getattr(settings, "IMPORT_PREPARE_WORKERS", 1)
+        return max(int(workers), 1)
 
-        instances = []
-        seen_keys = set()
-        for _, row in df.iterrows():
+    def _prepared_chunks(self, chunks):
+        """(bloco, geometrias preparadas) de cada bloco, na ordem do arquivo.
+        Com pool, no máximo `prepare_workers` blocos ficam em preparo além do
+        que está sendo gravado — a memória continua limitada. O pool só é
+        encerrado quando o gerador termina ou é fechado (`close()`), e a
+        conexão com o banco deve estar fechada antes do primeiro bloco (ver
+        `execute`)."""
+        workers = self._prepare_workers()
+        if workers == 1:
+            for df in chunks:
+                yield df, prepare_geometries(_geometry_array(df))
+            return
+
+        pool = Pool(processes=workers)
+        try:
+            pending = deque()
+            for df in chunks:
+                pending.append((df, pool.apply_async(prepare_geometries, (_geometry_array(df),))))
+                if len(pending) > workers:
+                    df, result = pending.popleft()
+                    yield df, result.get()
+            while pending:
+                df, result = pending.popleft()
+                yield df, result.get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _prepare_chunk(self, df, geometries, user, loader, seen_keys):
+        """Registros de um bloco: tuplas do COPY (`loader`) ou instâncias
+        para o `bulk_create`. `seen_keys` acumula as `natural_key` entre os
+        blocos."""
+        columns = self.format_columns(df)
+        if columns is not None:
+            columns = columns.to_dict("records")
+        rows = df.drop(columns=df.geometry.name).to_dict("records")
+
+        records = []
+        for i, row in enumerate(rows):
             key = self.natural_key(row)
             if key is not None:
                 if key in seen_keys:
                     continue
                 seen_keys.add(key)
-            instances.append(self._build_instance(row, user))
 
-        # Bases grandes (dezenas/centenas de milhares de linhas) podem levar
-        # minutos só para montar as instâncias em memória, e nesse meio-tempo
-        # a conexão com o banco (aberta desde o início do processo) pode cair
-        # por timeout de rede/idle. `close_if_unusable_or_obsolete` não é
-        # suficiente aqui: se a conexão ficou "meio aberta" (o outro lado
-        # derrubou sem enviar FIN, comum atrás de NAT/firewall), o ping de
-        # usabilidade trava esperando resposta em vez de detectar a falha —
-        # por isso fechamos incondicionalmente para forçar reconexão.
-        connection.close()
+            fields = columns[i] if columns is not None else self.format_fields(row)
+            instance = self._build_instance(fields, user, geometries["wkt"][i])
+            self._apply_area(instance, geometries["area_m2"][i])
+            ewkb, ewkb_utm = geometries["ewkb"][i], geometries["ewkb_utm"][i]
+            if loader:
+                # A instância é descartada logo depois de preparada e as
+                # geometrias seguem no EWKB já gerado, sem passar de novo
+                # pelo GEOS.
+                records.append(loader.row(instance, usable_geometry=ewkb, usable_geometry_utm=ewkb_utm))
+            else:
+                if ewkb is not None:
+                    instance.usable_geometry = GEOSGeometry(memoryview(ewkb))
+                    instance.usable_geometry_utm = GEOSGeometry(memoryview(ewkb_utm))
+                records.append(instance)
+        return records
+
+    def _load(self, loader, records):
+        if loader:
+            return loader.load(records)
+        self.model.objects.bulk_create(records, batch_size=self.batch_size)
+        return len(records)
+
+    def execute(self):
+        user = self._get_user()
+        path = self._get_archive_path()
+        staging = StagingTableService(self.model) if self._copy_enabled() else None
+        loader = CopyLoader(self.model, table=staging.table_name) if staging else None
+        seen_keys = set()
+
+        if self._prepare_workers() > 1:
+            # Os processos do pool nascem de um fork: não podem herdar a
+            # conexão aberta com o banco (o importador reconecta ao gravar).
+            connection.close()
+        chunks = self._prepared_chunks(self.read_chunks(path))
+        try:
+            first = next(chunks, None)
+            first_records = self._prepare_chunk(*first, user, loader, seen_keys) if first is not None else []
+
+            # A leitura do arquivo pode levar minutos antes do primeiro acesso ao
+            # banco, e nesse meio-tempo a conexão (aberta desde o início do
+            # processo) pode cair por timeout de rede/idle.
+            # `close_if_unusable_or_obsolete` não é suficiente aqui: se a conexão
+            # ficou "meio aberta" (o outro lado derrubou sem enviar FIN, comum
+            # atrás de NAT/firewall), o ping de usabilidade trava esperando
+            # resposta em vez de detectar a falha — por isso fechamos
+            # incondicionalmente para forçar reconexão.
+            connection.close()
+
+            if staging:
+                staging.create()
+            else:
+                reset_db(self.model)
+
+            try:
+                total = 0
+                with transaction.atomic():
+                    total += self._load(loader, first_records)
+                    del first, first_records
+                    for df, geometries in chunks:
+                        total += self._load(loader, self._prepare_chunk(df, geometries, user, loader, seen_keys))
+
+                shadow = None
+                if self.subdivide_max_vertices:
+                    shadow = SubdividedGeometryService(self.model, self.subdivide_max_vertices)
+
+                if staging:
+                    staging.finish()
+                    if shadow:
+                        shadow.build(staging.table_name)
+                    staging.swap(shadow)
+                elif shadow:
+                    shadow.rebuild()
+            except Exception:
+                if staging:
+                    staging.discard()
+                raise
+        finally:
+            # Encerra o pool de preparo já aqui, também quando a carga falha
+            # no meio: um gerador suspenso manteria os processos vivos dentro
+            # do worker do Celery.
+            chunks.close()
 
-        reset_db(self.model)
+        # Buscas feitas durante a carga podem ter cacheado contagem/prontidão
+        # da tabela anterior.
+        invalidate_layer_caches(self.model)
 
-        with transaction.atomic():
-            self.model.objects.bulk_create(instances, batch_size=self.batch_size)
+        return total
 
-        return len(instances)
+    def _copy_enabled(self):
+        return self.use_copy and connection.vendor == "postgresql"
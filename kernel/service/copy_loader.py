@@ -0,0 +1,89 @@
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection
+from psycopg.postgres import types as pg_types
+from psycopg.sql import SQL, Identifier
+
+# Colunas geométricas vão no COPY binário como `bytea`: o servidor lê o
+# valor com a função de recepção do tipo da coluna (`geometry_recv`), que
+# aceita EWKB.
+_SPATIAL_TYPES = {"geometry", "geography"}
+
+
+class CopyLoader:
+    """
+    Grava instâncias (não salvas) de um Model direto na tabela com
+    `COPY ... FROM STDIN (FORMAT BINARY)` do psycopg 3, em vez de INSERTs
+    parametrizados do `bulk_create`.
+
+    Os valores de cada coluna passam pelo mesmo preparo do ORM
+    (`pre_save` + `get_db_prep_save`: `auto_now`, conversão de tipos), e as
+    geometrias seguem como EWKB. O id fica de fora e sai da sequência da
+    tabela. Os tipos do COPY são os do catálogo (`pg_attribute`), para que o
+    formato binário de cada coluna bata com a tabela real.
+    """
+
+    def __init__(self, model, table=None):
+        self.model = model
+        # Tabela de destino: a do Model ou uma com a mesma estrutura (ex.: a
+        # tabela de carga de `StagingTableService`).
+        self.table = table or model._meta.db_table
+        self.fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+
+    @property
+    def columns(self):
+        return [field.column for field in self.fields]
+
+    def row(self, instance, **encoded):
+        """Valores de `instance` na ordem de `columns`. `encoded` traz valores
+        já no formato do COPY por nome de campo (ex.: geometrias já em EWKB),
+        usados como estão."""
+        values = []
+        for field in self.fields:
+            if field.name in encoded:
+                values.append(encoded[field.name])
+                continue
+            value = field.pre_save(instance, True)
+            if isinstance(field, GeometryField):
+                values.append(bytes(value.ewkb) if isinstance(value, GEOSGeometry) else None)
+            else:
+                values.append(field.get_db_prep_save(value, connection))
+        return tuple(values)
+
+    def _column_type_oids(self, cursor):
+        cursor.execute(
+            """
+            SELECT a.attname, a.atttypid, t.typname
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+            """,
+            [connection.ops.quote_name(self.table)],
+        )
+        bytea_oid = pg_types.get("bytea").oid
+        oids = {
+            name: bytea_oid if typname in _SPATIAL_TYPES else oid
+            for name, oid, typname in cursor.fetchall()
+        }
+        return [oids[column] for column in self.columns]
+
+    def load(self, rows):
+        """Copia `rows` (tuplas de `row()`, na ordem de `columns`) para a
+        tabela. Deve rodar dentro de uma transação. Devolve quantas linhas
+        foram gravadas."""
+        statement = SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+            Identifier(self.table),
+            SQL(", ").join(Identifier(column) for column in self.columns),
+        )
+        count = 0
+        with connection.cursor() as cursor:
+            type_oids = self._column_type_oids(cursor)
+            with cursor.cursor.copy(statement) as copy:
+                copy.set_types(type_oids)
+                for row in rows:
+                    copy.write_row(row)
+                    count += 1
+        return count
@@ -1,5 +1,8 @@
 from django.contrib.gis.geos import GEOSGeometry
 
+from kernel.service.subdivided_geometry_service import SubdividedGeometryService
+from kernel.utils import invalidate_layer_caches
+
 
 class GeometryProcessingService:
     """
@@ -8,6 +11,7 @@ class GeometryProcessingService:
     1) Converting WKT → GEOSGeometry (SRID 4674)
     2) Fixing incorrect SRID values
     3) Calculating area in m² and ha using UTM Zone 22S (EPSG:31982)
+       and storing the projected copy in `usable_geometry_utm`
     """
 
     def __init__(self, model):
@@ -15,6 +19,7 @@ class GeometryProcessingService:
         :param model: Django Model containing:
             - geometry (TextField com WKT)
             - usable_geometry (GeometryField SRID=4674)
+            - usable_geometry_utm (GeometryField SRID=31982)
             - area_m2 (FloatField)
             - area_ha (FloatField)
         """
@@ -43,20 +48,43 @@ class GeometryProcessingService:
                     geom = geom.buffer(0)
 
                 obj.usable_geometry = geom
+                obj.usable_geometry_utm = geom.transform(31982, clone=True)
                 pending.append(obj)
                 count += 1
             except Exception:
                 continue
 
             if len(pending) >= batch_size:
-                self.model.objects.bulk_update(pending, ["usable_geometry"], batch_size=batch_size)
+                self.model.objects.bulk_update(
+                    pending, ["usable_geometry", "usable_geometry_utm"], batch_size=batch_size
+                )
                 pending = []
 
         if pending:
-            self.model.objects.bulk_update(pending, ["usable_geometry"], batch_size=batch_size)
+            self.model.objects.bulk_update(
+                pending, ["usable_geometry", "usable_geometry_utm"], batch_size=batch_size
+            )
 
+        if count:
+            self._invalidate_derived_data()
         return count
 
+    def _invalidate_derived_data(self, ids=None):
+        """
+        Geometrias mudaram: descarta caches da camada e atualiza a
+        tabela-sombra subdividida — só os pedaços das feições `ids` ou, sem
+        `ids` (correção em lote), a tabela inteira, gerada de novo em
+        paralelo à atual. O tamanho dos pedaços é o gravado na tabela-sombra
+        pelo importador (`subdivide_max_vertices`).
+        """
+        shadow = SubdividedGeometryService(self.model)
+        if shadow.is_available():
+            if ids is None:
+                shadow.rebuild()
+            else:
+                shadow.refresh_features(ids)
+        invalidate_layer_caches(self.model)
+
     # ============================================================
     # 2) FIX WRONG SRID
     # ============================================================
@@ -95,7 +123,9 @@ class GeometryProcessingService:
     def calculate_fixed_areas(self, batch_size=500):
         """
         Calculates fixed areas in m² and hectares using
-        UTM Zone 22S projection (EPSG:31982).
+        UTM Zone 22S projection (EPSG:31982). A geometria projetada é gravada
+        em `usable_geometry_utm` no mesmo passo — serve também para preencher
+        a coluna em linhas importadas antes dela existir.
         """
         queryset = self.model.objects.exclude(usable_geometry__isnull=True)
 
@@ -105,6 +135,7 @@ class GeometryProcessingService:
             try:
                 geom_utm = obj.usable_geometry.transform(31982, clone=True)
 
+                obj.usable_geometry_utm = geom_utm
                 obj.area_m2 = geom_utm.area
                 obj.area_ha = geom_utm.area / 10000
                 pending.append(obj)
@@ -113,12 +144,18 @@ class GeometryProcessingService:
                 continue
 
             if len(pending) >= batch_size:
-                self.model.objects.bulk_update(pending, ["area_m2", "area_ha"], batch_size=batch_size)
+                self.model.objects.bulk_update(
+                    pending, ["usable_geometry_utm", "area_m2", "area_ha"], batch_size=batch_size
+                )
                 pending = []
 
         if pending:
-            self.model.objects.bulk_update(pending, ["area_m2", "area_ha"], batch_size=batch_size)
+            self.model.objects.bulk_update(
+                pending, ["usable_geometry_utm", "area_m2", "area_ha"], batch_size=batch_size
+            )
 
+        if count:
+            invalidate_layer_caches(self.model)
         return count
 
     # ============================================================
@@ -144,7 +181,8 @@ class GeometryProcessingService:
         Processa um único objeto:
         - Converte WKT (field `geometry`) para GEOSGeometry com SRID 4674
         - Corrige SRID se necessário
-        - Calcula área fixa (m² e ha) em UTM 22S (EPSG:31982)
+        - Calcula área fixa (m² e ha) em UTM 22S (EPSG:31982) e guarda a
+          geometria projetada em `usable_geometry_utm`
         """
         try:
             if not getattr(obj, "geometry", None):
@@ -161,9 +199,11 @@ class GeometryProcessingService:
             area_ha = area_m2 / 10000
 
             obj.usable_geometry = geom
+            obj.usable_geometry_utm = geom_utm
             obj.area_m2 = area_m2
             obj.area_ha = area_ha
-            obj.save(update_fields=["usable_geometry", "area_m2", "area_ha"])
+            obj.save(update_fields=["usable_geometry", "usable_geometry_utm", "area_m2", "area_ha"])
+            self._invalidate_derived_data(ids=[obj.pk])
             return True
         except Exception:
             return False
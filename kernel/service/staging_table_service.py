@@ -0,0 +1,176 @@
+import hashlib
+import time
+
+from django.db import OperationalError, connection, transaction
+
+# SQLSTATE de `lock_not_available` (estourou o `lock_timeout`).
+_LOCK_NOT_AVAILABLE = "55P03"
+
+
+def _is_lock_timeout(exc):
+    cause = exc.__cause__
+    return (getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)) == _LOCK_NOT_AVAILABLE
+
+
+class StagingTableService:
+    """
+    Recarga de uma camada sem deixar as buscas verem a tabela vazia.
+
+    A importação grava em uma tabela de carga (`<tabela>_carga`, mesma
+    estrutura da camada: colunas, defaults, identidade e CHECKs). Depois da
+    carga, `finish` cria nela os índices, as constraints (chave primária,
+    unique, FKs) e roda o ANALYZE, tudo fora do caminho das buscas; `swap`
+    então troca as tabelas por rename em uma transação curta. Até lá as
+    buscas seguem lendo a versão anterior, sem disputar lock com a carga.
+
+    Índices e constraints com índice ganham nomes provisórios na tabela de
+    carga (nomes de índice são únicos no schema) e voltam aos nomes
+    originais na troca. A sequência do id acompanha a tabela nova: a de
+    identidade é a da própria tabela de carga (ids recomeçam em 1, como no
+    `reset_db`); uma `serial` antiga passa a pertencer à tabela nova antes de
+    a antiga ser descartada.
+
+    O rename precisa de lock exclusivo na camada: a troca espera no máximo
+    `lock_timeout_ms` pelas consultas em andamento (sem enfileirar as buscas
+    novas atrás dela por mais que isso) e tenta de novo até `swap_attempts`
+    vezes.
+    """
+
+    suffix = "_carga"
+    old_suffix = "_antiga"
+    lock_timeout_ms = 5000
+    swap_attempts = 5
+    swap_retry_delay = 2
+
+    def __init__(self, model):
+        self.model = model
+        self.live_table = model._meta.db_table
+        self.table_name = f"{self.live_table}{self.suffix}"
+        self.pk_column = model._meta.pk.column
+        self._renames = []
+
+    def _temp_name(self, name):
+        digest = hashlib.md5(f"{self.table_name}:{name}".encode()).hexdigest()[:16]
+        return f"carga_{digest}"
+
+    def create(self):
+        """(Re)cria a tabela de carga vazia."""
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {qn(self.table_name)}")
+            cursor.execute(
+                f"CREATE TABLE {qn(self.table_name)} (LIKE {qn(self.live_table)} "
+                f"INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+            )
+
+    def finish(self):
+        """Índices, constraints e estatísticas da tabela de carga, com os
+        mesmos definidos na camada."""
+        qn = connection.ops.quote_name
+        staging = qn(self.table_name)
+        self._renames = []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT ci.relname, pg_get_indexdef(i.indexrelid), con.conname, con.contype,
+                       pg_get_constraintdef(con.oid)
+                FROM pg_index i
+                JOIN pg_class ci ON ci.oid = i.indexrelid
+                LEFT JOIN pg_constraint con
+                  ON con.conindid = i.indexrelid AND con.conrelid = i.indrelid
+                WHERE i.indrelid = %s::regclass
+                """,
+                [qn(self.live_table)],
+            )
+            indexes = cursor.fetchall()
+
+            cursor.execute(
+                """
+                SELECT conname, pg_get_constraintdef(oid)
+                FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype = 'f'
+                """,
+                [qn(self.live_table)],
+            )
+            foreign_keys = cursor.fetchall()
+
+            for index_name, index_def, con_name, con_type, con_def in indexes:
+                temp = self._temp_name(index_name)
+                if con_type and con_type not in ("p", "u"):
+                    # Demais constraints com índice (ex.: EXCLUDE).
+                    cursor.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {qn(temp)} {con_def}")
+                    self._renames.append(("constraint", temp, con_name))
+                    continue
+
+                unique = "UNIQUE " if index_def.startswith("CREATE UNIQUE") else ""
+                definition = index_def.split(" USING ", 1)[1]
+                cursor.execute(f"CREATE {unique}INDEX {qn(temp)} ON {staging} USING {definition}")
+                if con_type:
+                    kind = "PRIMARY KEY" if con_type == "p" else "UNIQUE"
+                    cursor.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {qn(temp)} {kind} USING INDEX {qn(temp)}")
+                    self._renames.append(("constraint", temp, con_name))
+                else:
+                    self._renames.append(("index", temp, index_name))
+
+            # Nomes de FK só precisam ser únicos na tabela: entram direto com
+            # o nome original.
+            for con_name, con_def in foreign_keys:
+                cursor.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {qn(con_name)} {con_def}")
+
+            cursor.execute(f"ANALYZE {staging}")
+
+    def _swap_once(self, shadow):
+        qn = connection.ops.quote_name
+        live = qn(self.live_table)
+        old = f"{self.live_table}{self.old_suffix}"
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('lock_timeout', %s, true)", [str(int(self.lock_timeout_ms))]
+                )
+                cursor.execute(
+                    "SELECT pg_get_serial_sequence(%s, %s), pg_get_serial_sequence(%s, %s)",
+                    [live, self.pk_column, qn(self.table_name), self.pk_column],
+                )
+                live_seq, staging_seq = cursor.fetchone()
+
+                cursor.execute(f"ALTER TABLE {live} RENAME TO {qn(old)}")
+                cursor.execute(f"ALTER TABLE {qn(self.table_name)} RENAME TO {live}")
+                if live_seq and not staging_seq:
+                    # `serial`: o default da tabela nova usa a sequência da
+                    # antiga, que seria descartada junto com ela.
+                    cursor.execute(f"ALTER SEQUENCE {live_seq} OWNED BY {live}.{qn(self.pk_column)}")
+                cursor.execute(f"DROP TABLE {qn(old)}")
+
+                for kind, temp, original in self._renames:
+                    if kind == "constraint":
+                        cursor.execute(f"ALTER TABLE {live} RENAME CONSTRAINT {qn(temp)} TO {qn(original)}")
+                    else:
+                        cursor.execute(f"ALTER INDEX {qn(temp)} RENAME TO {qn(original)}")
+                if live_seq and staging_seq:
+                    # Identidade: a sequência da tabela de carga assume o nome
+                    # da anterior (já descartada com a tabela antiga).
+                    seq_name = live_seq.rsplit(".", 1)[-1].strip('"')
+                    cursor.execute(f"ALTER SEQUENCE {staging_seq} RENAME TO {qn(seq_name)}")
+
+                if shadow is not None:
+                    shadow.install(cursor)
+
+    def swap(self, shadow=None):
+        """Troca a camada pela tabela de carga (e, com `shadow`, a
+        tabela-sombra pela gerada de `SubdividedGeometryService.build`) em
+        uma única transação."""
+        for attempt in range(1, self.swap_attempts + 1):
+            try:
+                self._swap_once(shadow)
+                return
+            except OperationalError as exc:
+                if not _is_lock_timeout(exc) or attempt == self.swap_attempts:
+                    raise
+                time.sleep(self.swap_retry_delay)
+
+    def discard(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(self.table_name)}")
@@ -0,0 +1,169 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+class SubdividedGeometryService:
+    """
+    Mantém a tabela-sombra `<tabela>_subdividida_utm` de uma camada com polígonos
+    enormes (municípios, zoneamento, fitoecologia, APAs).
+
+    Cada feição é quebrada com `ST_Subdivide` em pedaços de no máximo
+    `max_vertices` vértices, com índice GiST próprio. A caixa de cada pedaço
+    é pequena, então o índice realmente filtra e o `ST_Intersection` roda
+    contra poucos vértices; a análise de sobreposição reagrupa os pedaços
+    por `id_feicao` (id da linha original). Os pedaços são gerados a partir
+    de `usable_geometry_utm` (EPSG:31982), para que a intersecção e a área
+    saiam direto em metros, sem reprojeção por busca.
+
+    A tabela-sombra é derivada: é reconstruída pelo importador depois da
+    carga e descartada sempre que a camada é esvaziada (`reset_db`) — os ids
+    da tabela original reiniciam e os pedaços antigos apontariam para as
+    feições erradas. Feições com a geometria corrigida têm só os próprios
+    pedaços refeitos (`refresh_features`).
+
+    Na recarga por tabela de carga (`StagingTableService`), os pedaços são
+    gerados da tabela de carga (`build`) e instalados (`install`) na mesma
+    transação que troca a camada.
+    """
+
+    suffix = "_subdividida_utm"
+    default_max_vertices = 256
+    # O `max_vertices` usado fica no comentário da tabela-sombra, para que a
+    # atualização fora do importador (`refresh_features`, `rebuild` sem
+    # valor informado) gere pedaços do mesmo tamanho.
+    comment_prefix = "max_vertices="
+
+    def __init__(self, model, max_vertices=None):
+        self.model = model
+        self._max_vertices = max_vertices
+
+    @property
+    def max_vertices(self):
+        """O informado; senão o gravado na tabela-sombra atual; senão
+        `default_max_vertices`."""
+        if self._max_vertices is None:
+            self._max_vertices = self._stored_max_vertices() or self.default_max_vertices
+        return self._max_vertices
+
+    def _stored_max_vertices(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT obj_description(to_regclass(%s), 'pg_class')", [self.table_name]
+            )
+            row = cursor.fetchone()
+        comment = (row[0] if row else None) or ""
+        if comment.startswith(self.comment_prefix):
+            try:
+                return int(comment[len(self.comment_prefix):])
+            except ValueError:
+                return None
+        return None
+
+    @property
+    def table_name(self):
+        return f"{self.model._meta.db_table}{self.suffix}"
+
+    @staticmethod
+    def cache_key(model):
+        return f"layer_subdivided:{model.__name__}"
+
+    def is_available(self, timeout=300):
+        """Indica (com cache curto) se a tabela-sombra existe."""
+        key = self.cache_key(self.model)
+        available = cache.get(key)
+        if available is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [self.table_name])
+                available = cursor.fetchone()[0]
+            cache.set(key, available, timeout)
+        return available
+
+    @property
+    def building_table_name(self):
+        return f"{self.table_name}_tmp"
+
+    def build(self, source_table=None):
+        """
+        Gera os pedaços em uma tabela temporária, a partir da tabela da
+        camada ou de `source_table` (mesma estrutura, ex.: a tabela de carga
+        de uma importação). A troca pela tabela-sombra atual fica para
+        `install`.
+        """
+        qn = connection.ops.quote_name
+        source = qn(source_table or self.model._meta.db_table)
+        geom_col = qn(self.model._meta.get_field("usable_geometry").column)
+        utm_col = qn(self.model._meta.get_field("usable_geometry_utm").column)
+        building = self.building_table_name
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {qn(building)}")
+            cursor.execute(
+                f"CREATE TABLE {qn(building)} AS "
+                f"SELECT id AS id_feicao, ST_Subdivide(COALESCE({utm_col}, "
+                f"ST_Transform({geom_col}, 31982)), {int(self.max_vertices)}) AS geometria "
+                f"FROM {source} WHERE {geom_col} IS NOT NULL"
+            )
+            cursor.execute(
+                f"CREATE INDEX {qn(building + '_gix')} ON {qn(building)} USING GIST (geometria)"
+            )
+            cursor.execute(f"CREATE INDEX {qn(building + '_fid')} ON {qn(building)} (id_feicao)")
+            # COMMENT não aceita parâmetros; o valor é um inteiro.
+            cursor.execute(
+                f"COMMENT ON TABLE {qn(building)} IS '{self.comment_prefix}{int(self.max_vertices)}'"
+            )
+            cursor.execute(f"ANALYZE {qn(building)}")
+
+    def install(self, cursor):
+        """Troca a tabela-sombra atual pela gerada em `build`. Roda dentro
+        da transação do chamador."""
+        qn = connection.ops.quote_name
+        target = self.table_name
+        building = self.building_table_name
+        cursor.execute(f"DROP TABLE IF EXISTS {qn(target)}")
+        cursor.execute(f"ALTER TABLE {qn(building)} RENAME TO {qn(target)}")
+        cursor.execute(f"ALTER INDEX {qn(building + '_gix')} RENAME TO {qn(target + '_gix')}")
+        cursor.execute(f"ALTER INDEX {qn(building + '_fid')} RENAME TO {qn(target + '_fid')}")
+
+    def rebuild(self):
+        """
+        Gera os pedaços em uma tabela temporária e só então troca pela
+        tabela-sombra atual, em uma transação curta — buscas em andamento
+        continuam usando a versão anterior enquanto a nova é montada.
+        """
+        self.build()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self.install(cursor)
+
+        cache.delete(self.cache_key(self.model))
+
+    def refresh_features(self, ids):
+        """
+        Refaz os pedaços só das feições `ids` (apaga e gera de novo a partir
+        da geometria atual), na mesma transação — as demais feições não são
+        tocadas. Sem tabela-sombra, não faz nada.
+        """
+        ids = [int(pk) for pk in ids]
+        if not ids or not self.is_available():
+            return
+        qn = connection.ops.quote_name
+        source = qn(self.model._meta.db_table)
+        geom_col = qn(self.model._meta.get_field("usable_geometry").column)
+        utm_col = qn(self.model._meta.get_field("usable_geometry_utm").column)
+        target = qn(self.table_name)
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {target} WHERE id_feicao = ANY(%s)", [ids])
+                cursor.execute(
+                    f"INSERT INTO {target} (id_feicao, geometria) "
+                    f"SELECT id, ST_Subdivide(COALESCE({utm_col}, "
+                    f"ST_Transform({geom_col}, 31982)), {int(self.max_vertices)}) "
+                    f"FROM {source} WHERE id = ANY(%s) AND {geom_col} IS NOT NULL",
+                    [ids],
+                )
+
+    def drop(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(self.table_name)}")
+        cache.delete(self.cache_key(self.model))
@@ -142,6 +142,70 @@ CACHES = {
 }
 
 
+# Análise de sobreposição
+# "single_query" envia todas as camadas em um único UNION ALL ao PostGIS;
+# "parallel" faz uma consulta por camada em até OVERLAP_MAX_WORKERS threads
+# (cada uma com a sua conexão ao banco); "sequential" faz uma consulta por
+# camada, uma após a outra (comportamento original).
+
+OVERLAP_EXECUTION_MODE = config('OVERLAP_EXECUTION_MODE', default='single_query')
+OVERLAP_MAX_WORKERS = config('OVERLAP_MAX_WORKERS', default=4, cast=int)
+
+# Limites de tempo da análise de sobreposição (ms; 0 desliga): cada consulta
+# ao banco roda com statement_timeout de até OVERLAP_LAYER_TIMEOUT_MS, sem
+# passar do que resta de OVERLAP_SEARCH_TIMEOUT_MS para a busca inteira
+# (abaixo do harakiri de 180 s do uwsgi). A camada que estoura o limite sai
+# como "não avaliada" e o restante do resultado é devolvido.
+OVERLAP_LAYER_TIMEOUT_MS = config('OVERLAP_LAYER_TIMEOUT_MS', default=30000, cast=int)
+OVERLAP_SEARCH_TIMEOUT_MS = config('OVERLAP_SEARCH_TIMEOUT_MS', default=150000, cast=int)
+
+# Métricas das buscas no formato do Prometheus (/metrics, só na rede interna).
+# Os contadores são somados em um hash do Redis, compartilhado por todos os
+# processos uwsgi e workers Celery.
+METRICS_ENABLED = config_bool('METRICS_ENABLED', default=True)
+METRICS_REDIS_URL = config('METRICS_REDIS_URL', default=config('REDIS_URL', default='redis://127.0.0.1:6379/1'))
+# Sem METRICS_TOKEN, /metrics responde 404 (a porta 8000 é publicada no host).
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Cache de resultados de sobreposição por camada: LRU em memória do processo
+# na frente do Redis. A chave inclui a versão de dados da camada, trocada a
+# cada importação/reset, então não há invalidação manual a fazer.
+OVERLAP_CACHE_ENABLED = config_bool('OVERLAP_CACHE_ENABLED', default=True)
+OVERLAP_CACHE_TIMEOUT = config('OVERLAP_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+OVERLAP_CACHE_LOCAL_ENTRIES = config('OVERLAP_CACHE_LOCAL_ENTRIES', default=256, cast=int)
+
+# Resultado da última análise do usuário: fica comprimido no cache (Redis)
+# por ANALYSIS_RESULT_TTL segundos; a sessão guarda só o id.
+ANALYSIS_RESULT_CACHE = config('ANALYSIS_RESULT_CACHE', default='default')
+ANALYSIS_RESULT_TTL = config('ANALYSIS_RESULT_TTL', default=60 * 60 * 24, cast=int)
+
+# Buscas executadas no worker Celery (run_analysis_job): a requisição só
+# enfileira e a página de espera acompanha o progresso por polling. Com o
+# broker fora do ar (ou a flag desligada) a busca roda na própria view.
+ANALYSIS_JOBS_ENABLED = config_bool('ANALYSIS_JOBS_ENABLED', default=True)
+ANALYSIS_JOB_TIME_LIMIT = config('ANALYSIS_JOB_TIME_LIMIT', default=15 * 60, cast=int)
+# Limite rígido: o worker mata o processo do job que ignorou o limite acima.
+ANALYSIS_JOB_HARD_TIME_LIMIT = config(
+    'ANALYSIS_JOB_HARD_TIME_LIMIT', default=ANALYSIS_JOB_TIME_LIMIT + 60, cast=int
+)
+
+# Importação das bases de SHP: número de processos que preparam as
+# geometrias (make_valid, reprojeção, áreas) em paralelo. Cada importador pode
+# fixar o seu em `prepare_workers`.
+IMPORT_PREPARE_WORKERS = config('IMPORT_PREPARE_WORKERS', default=4, cast=int)
+
+# Tiles vetoriais das camadas (/tiles/<modelo>/<z>/<x>/<y>.pbf): abaixo do zoom
+# mínimo o tile sai vazio (bases como SICAR teriam o estado inteiro em um
+# tile); tiles gerados ficam no Redis até a próxima importação da camada.
+VECTOR_TILE_MIN_ZOOM = config('VECTOR_TILE_MIN_ZOOM', default=6, cast=int)
+VECTOR_TILE_CACHE_TIMEOUT = config('VECTOR_TILE_CACHE_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)
+# Tempo máximo da consulta que gera um tile fora do cache (roda no uwsgi); ao
+# estourar, a rota responde 503 e o tile só é tentado de novo após
+# VECTOR_TILE_RETRY_AFTER segundos.
+VECTOR_TILE_STATEMENT_TIMEOUT_MS = config('VECTOR_TILE_STATEMENT_TIMEOUT_MS', default=5000, cast=int)
+VECTOR_TILE_RETRY_AFTER = config('VECTOR_TILE_RETRY_AFTER', default=300, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -221,3 +285,10 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# As buscas (run_analysis_job) têm fila própria, consumida por um worker só
+# delas: uma importação de base de horas na fila padrão não segura a busca
+# de um usuário.
+ANALYSIS_JOB_QUEUE = config('ANALYSIS_JOB_QUEUE', default='buscas')
+CELERY_TASK_ROUTES = {
+    'analysis.tasks.run_analysis_job': {'queue': ANALYSIS_JOB_QUEUE},
+}
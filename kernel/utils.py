@@ -1,3 +1,5 @@
+import uuid
+
 import pyproj
 from shapely import wkt
 import geopandas as gpd
@@ -9,6 +11,7 @@ from decimal import Decimal, InvalidOperation
 from django.core.cache import cache
 from django.db import models
 from kernel.service.database_maintenance_service import DatabaseMaintenanceService
+from kernel.service.subdivided_geometry_service import SubdividedGeometryService
 
 def base_result(
     base_name: str,
@@ -141,6 +144,60 @@ def cached_model_count(model: models.Model, timeout: int = 300) -> int:
     return count
 
 
+def layer_ready_cache_key(model) -> str:
+    return f"layer_ready:{model.__name__}"
+
+
+def is_layer_geometry_ready(model: models.Model, timeout: int = 300) -> bool:
+    """Indica se todas as linhas da camada já têm `usable_geometry`.
+
+    Quando sim, um resultado vazio da consulta espacial é confiável e a
+    análise de sobreposição não precisa do fallback em WKT textual. Cache
+    curto, invalidado por `invalidate_layer_caches`."""
+    key = layer_ready_cache_key(model)
+    ready = cache.get(key)
+    if ready is None:
+        ready = not model.objects.filter(usable_geometry__isnull=True).exists()
+        cache.set(key, ready, timeout)
+    return ready
+
+
+def layer_version_cache_key(model) -> str:
+    return f"layer_version:{model.__name__}"
+
+
+def get_layer_versions(layer_models) -> Dict[str, str]:
+    """{nome_do_modelo: versão} do conteúdo atual de cada camada, em uma única
+    ida ao cache. A versão é um token opaco trocado por
+    `invalidate_layer_caches`; camadas ainda sem versão (ou com o cache
+    esvaziado) recebem um token novo, para nunca casar com entradas antigas."""
+    keys = {layer_version_cache_key(m): m.__name__ for m in layer_models}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, name in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+        versions[name] = version
+    return versions
+
+
+def invalidate_layer_caches(model: models.Model):
+    """Descarta os caches derivados do conteúdo de uma camada — chamado
+    sempre que a tabela é esvaziada ou recarregada. Troca também a versão da
+    camada, invalidando só as entradas dela no cache de sobreposição."""
+    cache.delete_many([
+        model_count_cache_key(model),
+        layer_ready_cache_key(model),
+        SubdividedGeometryService.cache_key(model),
+    ])
+    cache.set(layer_version_cache_key(model), uuid.uuid4().hex, None)
+
+
 def reset_db(model: models.Model):
     DatabaseMaintenanceService().truncate_and_reset(model._meta.db_table, 'public', cascade=True)
-    cache.delete(model_count_cache_key(model))
+    # Os ids reiniciam: pedaços antigos da tabela-sombra apontariam para as
+    # feições erradas.
+    SubdividedGeometryService(model).drop()
+    invalidate_layer_caches(model)
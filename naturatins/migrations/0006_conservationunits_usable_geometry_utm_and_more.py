@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('naturatins', '0005_remove_conservationunits_geometry_new_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conservationunits',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='municipalboundaries',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='paths',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+        migrations.AddField(
+            model_name='quilombolas',
+            name='usable_geometry_utm',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, db_column='geometria_util_utm', null=True, spatial_index=False, srid=31982),
+        ),
+    ]
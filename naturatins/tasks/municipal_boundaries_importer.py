@@ -6,6 +6,7 @@ class MunicipalBoundariesImporter(BulkShapefileImporter):
     model = MunicipalBoundaries
     archive_field = "municipal_boundaries_zip_file"
     source = "Base Municípios"
+    subdivide_max_vertices = 256
 
     def missing_archive_message(self):
         return "Nenhum arquivo de municípios foi configurado."